@@ -1,7 +1,18 @@
+import numpy as np
 import pandas as pd
 import re
 import os
 
+import tempo
+from adaptadores import carregar_eventos
+from contraparte import casar_contrapartes
+from invariantes import VerificadorInvariantes
+from ledger_db import exportar_sqlite
+from lotes import Inventario
+
+# Lista expandida para garantir detecção de Fiat/Estáveis que encerram o ciclo de isenção
+FIAT_LIST = ['Real Brasileiro', 'BRL', 'Euro', 'EUR', 'US Dollar', 'USD', 'cReal', 'BRLT', 'Tether', 'USDT', 'USDC']
+
 def clean_val(val_str):
     if pd.isna(val_str): return 0.0
     s = re.sub(r'[^\d,\.-]', '', str(val_str))
@@ -12,31 +23,58 @@ def clean_val(val_str):
     try: return float(s)
     except: return 0.0
 
-def processar_motor_v6(file_path):
-    if not os.path.exists(file_path):
-        print(f"Erro: Arquivo {file_path} não encontrado!")
-        return
+class EstadoFIFO:
+    # Estado do replay (inventário e relatórios acumulados). Pode ser mantido
+    # entre chamadas de replay_v6 para processar eventos novos de forma
+    # incremental (ver daemon.py), desde que sejam posteriores a ultimo_epoch.
+    def __init__(self, verificar=None, intervalo_verificacao=1000, compactar_lotes=False, registrar=False):
+        self.inventory = Inventario(compactar=compactar_lotes, registrar=registrar)
+        self.registrar = registrar
+        self.consumos = []  # linhagem consumo -> lote, só preenchida com registrar
+        self.log_irs = []
+        self.log_swaps = []
+        self.log_recon = []
+        self.verificador = VerificadorInvariantes(verificar, intervalo_verificacao, fiat=FIAT_LIST) if verificar else None
+        self.ultimo_epoch = None
+        self.ultimo_quando = None
 
-    df = pd.read_csv(file_path, sep=';')
-    df['Hora_Original'] = df['Hora'].astype(str)
-    df['Val_Numeric'] = df['Quantidade'].apply(clean_val)
-    df['Timestamp'] = pd.to_datetime(df['Data'] + ' ' + df['Hora'], dayfirst=True)
-    df = df.sort_values(['Timestamp', 'Categoria'])
+def preparar_eventos(df, casar_pernas=False, janela_casamento=0):
+    invalidos = df[df['Epoch'] == tempo.NAT]
+    if len(invalidos):
+        # Um relatório fiscal não pode perder linhas em silêncio
+        exemplos = invalidos[['Exchange', 'Moeda', 'Categoria', 'Val_Numeric']].head(5).to_string()
+        raise ValueError(f"{len(invalidos)} linha(s) com data/hora inválida no extrato:\n{exemplos}")
+    df = df.sort_values(['Epoch', 'Categoria'])
+    # Datas formatadas uma vez para a coluna inteira (não por grupo/lote)
+    df['Data_Str'] = tempo.formatar(df['Epoch'].to_numpy(), '%Y-%m-%d')
+    if casar_pernas:
+        # Contraparte e valor por perna (ver contraparte.py) em vez de por segundo
+        df = casar_contrapartes(df, janela_casamento, fiat=FIAT_LIST)
+    return df
 
-    inventory = {} 
-    # Lista expandida para garantir detecção de Fiat/Estáveis que encerram o ciclo de isenção
-    fiat_list = ['Real Brasileiro', 'BRL', 'Euro', 'EUR', 'US Dollar', 'USD', 'cReal', 'BRLT', 'Tether', 'USDT', 'USDC']
-    
-    log_irs = []    
-    log_swaps = []  
-    log_recon = []  
+def replay_v6(df, estado):
+    # df já passado por preparar_eventos
+    inventory = estado.inventory
+    consumos = estado.consumos
+    log_irs, log_swaps, log_recon = estado.log_irs, estado.log_swaps, estado.log_recon
+    verificador = estado.verificador
+    fiat_list = FIAT_LIST
+    casado = 'Contraparte' in df.columns
+    if verificador:
+        # Fluxos e saldos do extrato somados em bloco pelo verificador (sem hook por linha)
+        verificador.preparar(df)
 
-    for ts, group in df.groupby('Timestamp'):
-        data_s = ts.strftime('%Y-%m-%d')
-        hora_s = group['Hora_Original'].iloc[0]
+    for ep, group in df.groupby('Epoch'):
+        data_s = group['Data_Str'].iloc[0]
+        hora_s = group['Hora'].iloc[0]
+        quando = f"{data_s} {hora_s}"
         
         # 1. ENTRADAS DE CRIPTO (Aumentar Inventário)
         entradas = group[(group['Val_Numeric'] > 0) & (~group['Moeda'].isin(['Real Brasileiro', 'BRL', 'Euro', 'EUR']))]
+        # Máscaras do segundo calculadas uma vez por grupo (não por linha)
+        if not casado:
+            saidas_fiat = group[(group['Val_Numeric'] < 0) & (group['Moeda'].isin(fiat_list))]
+            custo_segundo = abs(saidas_fiat['Val_Numeric'].sum()) if not saidas_fiat.empty else 0.0
         
         for _, row in entradas.iterrows():
             moeda = row['Moeda']
@@ -46,75 +84,166 @@ def processar_motor_v6(file_path):
                 custo_total = 0.0
                 origem_ext = "Sim"
                 log_recon.append({'Data': data_s, 'Hora': hora_s, 'Moeda': moeda, 'Qtd': qtd, 'Tipo': 'Depósito', 'Status': 'Origem Externa (Custo 0)'})
+            elif not pd.isna(row['Custo']):
+                # Lote transferido de outra exchange com custo já conhecido
+                # (Ext marca os que vieram de depósito externo, ver adaptadores.py)
+                custo_total = row['Custo']
+                origem_ext = "Sim" if row['Ext'] else "Não"
+            elif casado:
+                origem_ext = "Não"
+                # O custo é o fiat que saiu na perna casada com esta entrada
+                custo_total = row['Valor_Contraparte'] if row['Contraparte'] in fiat_list else 0.0
             else:
                 origem_ext = "Não"
                 # O custo é a soma de tudo que saiu (negativo) neste segundo
-                saidas_fiat = group[(group['Val_Numeric'] < 0) & (group['Moeda'].isin(fiat_list))]
-                custo_total = abs(saidas_fiat['Val_Numeric'].sum()) if not saidas_fiat.empty else 0.0
+                custo_total = custo_segundo
 
-            if moeda not in inventory: inventory[moeda] = []
-            inventory[moeda].append({'qtd': qtd, 'custo': custo_total, 'data_acq': ts, 'ext': origem_ext})
+            inventory.adicionar(moeda, qtd, custo_total, ep, data_s, origem_ext == "Sim")
+            if verificador:
+                verificador.lote_adicionado(moeda, qtd, custo_total, comprado=origem_ext == "Não" and pd.isna(row['Custo']))
 
         # 2. SAÍDAS DE CRIPTO (Vendas, Swaps, Retiradas)
         saidas_cripto = group[(group['Val_Numeric'] < 0) & (~group['Moeda'].isin(['Real Brasileiro', 'BRL', 'Euro', 'EUR']))]
+        if not casado:
+            entradas_no_segundo = group[group['Val_Numeric'] > 0]
+            if not entradas_no_segundo.empty:
+                moeda_segundo = entradas_no_segundo['Moeda'].iloc[0]
+                valor_segundo = entradas_no_segundo['Val_Numeric'].sum()
+            else:
+                moeda_segundo = "Carteira Externa"
+                valor_segundo = 0.0
         
         for _, row_s in saidas_cripto.iterrows():
-            if "Taxa" in row_s['Categoria']: continue
+            if "Taxa" in row_s['Categoria']:
+                if verificador: verificador.ignorado(row_s['Moeda'], abs(row_s['Val_Numeric']))
+                continue
             
             moeda_v = row_s['Moeda']
             qtd_v = abs(row_s['Val_Numeric'])
             
             # Identificar contraparte (O que entrou?)
-            entradas_no_segundo = group[group['Val_Numeric'] > 0]
-            if not entradas_no_segundo.empty:
-                moeda_recebida = entradas_no_segundo['Moeda'].iloc[0]
-                valor_recebido = entradas_no_segundo['Val_Numeric'].sum()
+            if casado:
+                moeda_recebida = row_s['Contraparte']
+                valor_recebido = row_s['Valor_Contraparte']
             else:
-                moeda_recebida = "Carteira Externa"
-                valor_recebido = 0.0
+                moeda_recebida = moeda_segundo
+                valor_recebido = valor_segundo
 
             if moeda_v in inventory:
+                lotes_v = inventory[moeda_v]
                 restante = qtd_v
-                while restante > 1e-9 and inventory[moeda_v]:
-                    lote = inventory[moeda_v][0]
-                    qtd_a_retirar = min(lote['qtd'], restante)
+                while restante > 1e-9 and lotes_v:
+                    lote_qtd, lote_custo, _, lote_ext = lotes_v.cabeca()
+                    qtd_a_retirar = min(lote_qtd, restante)
                     
-                    prop_lote = qtd_a_retirar / lote['qtd']
+                    prop_lote = qtd_a_retirar / lote_qtd
                     prop_saida = qtd_a_retirar / qtd_v if qtd_v > 0 else 0
                     
-                    custo_lote = lote['custo'] * prop_lote
+                    # float64 do numpy: round() segue o arredondamento do numpy, como quando
+                    # o custo do lote vinha direto do pandas (antes dos arrays de lotes.py)
+                    custo_lote = np.float64(lote_custo * prop_lote)
                     valor_venda_lote = valor_recebido * prop_saida
                     
-                    dias = (ts - lote['data_acq']).days
-                    isento_status = "TBD" if lote['ext'] == "Sim" else f"{'SIM' if dias > 365 else 'NÃO'} ({dias} dias)"
+                    dias = lotes_v.dias_cabeca(ep)
+                    ext_s = "Sim" if lote_ext else "Não"
+                    isento_status = "TBD" if lote_ext else f"{'SIM' if dias > 365 else 'NÃO'} ({dias} dias)"
 
                     linha = {
                         'Data_Venda': data_s, 'Ativo': moeda_v, 'Moeda_Venda': moeda_recebida,
-                        'Valor_Venda': round(valor_venda_lote, 2), 'Data_Aquisicao': lote['data_acq'].strftime('%Y-%m-%d'),
-                        'Custo_Aquisicao_USD': round(custo_lote, 2), 'Origem_Externa': lote['ext'],
+                        'Valor_Venda': round(valor_venda_lote, 2), 'Data_Aquisicao': lotes_v.data_cabeca(),
+                        'Custo_Aquisicao_USD': round(custo_lote, 2), 'Origem_Externa': ext_s,
                         'Resultado': round(valor_venda_lote - custo_lote, 2), 'Isento_365d': isento_status
                     }
 
                     if "Retirada" in row_s['Categoria']:
                         log_recon.append({'Data': data_s, 'Hora': hora_s, 'Moeda': moeda_v, 'Qtd': qtd_v, 'Tipo': 'Retirada', 'Status': 'Saída para Externa'})
+                        destino = 'Retirada'
                     elif moeda_recebida in ['Real Brasileiro', 'BRL', 'Euro', 'EUR', 'BRLT']:
                         log_irs.append(linha)
+                        destino = 'IRS'
                     else:
                         log_swaps.append(linha)
+                        destino = 'Swap'
+
+                    if estado.registrar:
+                        consumos.append((len(consumos) + 1, lotes_v.id_cabeca(), moeda_v, int(ep), data_s, hora_s, qtd_a_retirar,
+                                         custo_lote, valor_venda_lote, moeda_recebida, destino, None if lote_ext else int(dias)))
+
+                    if verificador:
+                        swap = "Retirada" not in row_s['Categoria'] and moeda_recebida not in ['Real Brasileiro', 'BRL', 'Euro', 'EUR', 'BRLT'] and moeda_v not in fiat_list
+                        verificador.lote_consumido(moeda_v, qtd_a_retirar, custo_lote, swap=swap)
 
-                    if lote['qtd'] <= restante:
-                        restante -= lote['qtd']
-                        inventory[moeda_v].pop(0)
+                    if lote_qtd <= restante:
+                        restante -= lote_qtd
+                        lotes_v.remover_cabeca()
                     else:
-                        lote['qtd'] -= restante
-                        lote['custo'] -= custo_lote
+                        lotes_v.reduzir_cabeca(restante, custo_lote)
                         restante = 0
 
+                if verificador and restante > 1e-9:
+                    verificador.falta(quando, moeda_v, restante)
+            elif verificador:
+                verificador.falta(quando, moeda_v, qtd_v)
+
+        if verificador:
+            verificador.fim_grupo(quando, inventory)
+
+        estado.ultimo_epoch = ep
+        estado.ultimo_quando = quando
+
+def gravar_relatorios(estado, out_dir='.'):
+    pd.DataFrame(estado.log_irs).to_csv(os.path.join(out_dir, 'Arquivo1_IRS.csv'), index=False, sep=';', encoding='utf-8-sig')
+    pd.DataFrame(estado.log_swaps).to_csv(os.path.join(out_dir, 'Arquivo2_Swaps.csv'), index=False, sep=';', encoding='utf-8-sig')
+    pd.DataFrame(estado.log_recon).to_csv(os.path.join(out_dir, 'Arquivo3_Reconciliacao.csv'), index=False, sep=';', encoding='utf-8-sig')
+
+def processar_motor_v6(file_path, verificar=None, intervalo_verificacao=1000, tz_fiscal=None, compactar_lotes=False,
+                       sqlite_path=None, casar_pernas=False, janela_casamento=0, resumos_dir=None):
+    # Aceita um extrato ou uma lista de extratos (de exchanges diferentes), que são
+    # normalizados pelos adaptadores e processados num único replay FIFO.
+    # verificar: None (desligado), "completo", "amostragem" ou "checkpoint" (ver invariantes.py)
+    # tz_fiscal: fuso para onde os horários dos extratos são convertidos (ex.: "Europe/Lisbon")
+    # compactar_lotes: junta lotes do mesmo segundo, origem e custo unitário (ver lotes.py)
+    # sqlite_path: exporta eventos, lotes, consumos e relatórios para uma base SQLite (ver ledger_db.py)
+    # casar_pernas: contraparte e valor por perna em segundos com várias trocas (ver contraparte.py);
+    #   janela_casamento: segundos extra para casar pernas liquidadas em segundos seguintes
+    # resumos_dir: guarda totais por ativo/ano/mês na cache servida por resumos.py
+    paths = [file_path] if isinstance(file_path, str) else list(file_path)
+    for p in paths:
+        if not os.path.exists(p):
+            print(f"Erro: Arquivo {p} não encontrado!")
+            return
+
+    df = preparar_eventos(carregar_eventos(paths, tz_fiscal=tz_fiscal), casar_pernas, janela_casamento)
+    estado = EstadoFIFO(verificar, intervalo_verificacao, compactar_lotes, registrar=bool(sqlite_path))
+    replay_v6(df, estado)
+    inventory, verificador = estado.inventory, estado.verificador
+
     # Gerar e Salvar
-    pd.DataFrame(log_irs).to_csv('Arquivo1_IRS.csv', index=False, sep=';', encoding='utf-8-sig')
-    pd.DataFrame(log_swaps).to_csv('Arquivo2_Swaps.csv', index=False, sep=';', encoding='utf-8-sig')
-    pd.DataFrame(log_recon).to_csv('Arquivo3_Reconciliacao.csv', index=False, sep=';', encoding='utf-8-sig')
+    gravar_relatorios(estado)
     
-    print(f"Sucesso! IRS: {len(log_irs)} | Swaps: {len(log_swaps)} | Recon: {len(log_recon)}")
+    print(f"Sucesso! IRS: {len(estado.log_irs)} | Swaps: {len(estado.log_swaps)} | Recon: {len(estado.log_recon)}")
+
+    if verificador:
+        verificador.finalizar(inventory, estado.ultimo_quando)
+        verificador.salvar('Arquivo4_Invariantes.csv', 'Arquivo4_Invariantes_Resumo.csv')
+        print(verificador)
+
+    if compactar_lotes:
+        print(inventory.resumo_memoria().to_string(index=False))
+
+    opcoes = {'tz_fiscal': tz_fiscal, 'compactar_lotes': compactar_lotes,
+              'casar_pernas': casar_pernas, 'janela_casamento': janela_casamento}
+    if sqlite_path:
+        run_id = exportar_sqlite(sqlite_path, paths, df, inventory.registro, estado.consumos, estado.log_recon, opcoes=opcoes)
+        if run_id is None:
+            print(f"SQLite: entradas já carregadas com estas opções em {sqlite_path}")
+        else:
+            print(f"SQLite: run {run_id} gravado em {sqlite_path} ({len(estado.consumos)} consumos, {len(inventory.registro)} lotes)")
+
+    if resumos_dir:
+        from resumos import guardar_resumo
+        chave = guardar_resumo(resumos_dir, paths, estado, df, opcoes)
+        print(f"Resumos: {chave} gravado em {resumos_dir}")
 
-processar_motor_v6('BitcoinTrade_statement.csv')
\ No newline at end of file
+if __name__ == "__main__":
+    processar_motor_v6('BitcoinTrade_statement.csv')
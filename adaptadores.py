@@ -0,0 +1,291 @@
+import csv
+import io
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+
+import tempo
+
+# Colunas da tabela de eventos normalizada (comum a todas as exchanges).
+# - Epoch: int64, segundos desde 1970 no relógio do fuso fiscal (ver tempo.py)
+# - Timestamp: datetime64 equivalente ao Epoch
+# - Hora: "HH:MM:SS" (texto, usado nos relatórios)
+# - Moeda: nome do ativo no padrão BitcoinTrade ("Bitcoin", "Real Brasileiro", ...)
+# - Categoria: categoria no padrão BitcoinTrade ("Compra", "Depósito bancário", ...)
+# - Val_Numeric: quantidade com sinal (float64)
+# - Saldo: saldo após o evento, quando o extrato o fornece (float64, NaN se ausente)
+# - Custo: custo conhecido do lote (float64, NaN = calcular pelo motor)
+# - Ext: lote de origem externa (bool). Só o adaptador de inventário o usa;
+#   nos restantes é False e a origem externa vem da categoria (depósitos)
+# - Exchange: origem do evento
+COLUNAS_EVENTOS = ["Epoch", "Timestamp", "Hora", "Moeda", "Categoria", "Val_Numeric", "Saldo", "Custo", "Ext", "Exchange"]
+
+# Tickers usados por outras exchanges -> nomes usados pela BitcoinTrade
+MOEDAS_ALIAS = {
+    "BTC": "Bitcoin",
+    "ETH": "Ethereum",
+    "LTC": "Litecoin",
+    "XRP": "XRP",
+    "CELO": "Celo",
+    "CREAL": "cReal",
+    "BRL": "Real Brasileiro",
+    "EUR": "Euro",
+    "USD": "US Dollar",
+    "USDT": "Tether",
+}
+
+SAMPLE_BYTES = 1024
+
+
+def clean_val_series(s: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de clean_val: mesmas regras ("-BTC 1.234,56" -> -1234.56),
+    inválidos/ausentes viram 0.0.
+    """
+    s = s.astype("string").str.replace(r"[^\d,\.-]", "", regex=True)
+    ambos = s.str.contains(",", regex=False) & s.str.contains(".", regex=False)
+    s = s.where(~ambos.fillna(False), s.str.replace(".", "", regex=False))
+    s = s.str.replace(",", ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0).astype("float64")
+
+
+def _normalizar_moeda(s: pd.Series) -> pd.Series:
+    s = s.astype(str).str.strip()
+    return s.map(lambda m: MOEDAS_ALIAS.get(m.upper(), m))
+
+
+@dataclass
+class Adaptador:
+    """
+    Descreve um formato de extrato: assinatura do cabeçalho, tipos das colunas
+    e a função que converte o DataFrame bruto na tabela de eventos (com a
+    coluna Epoch no relógio local do extrato, cujo fuso é `fuso`).
+    """
+    nome: str
+    assinatura: Sequence[str]
+    dtypes: Dict[str, str]
+    normalizar: Callable[[pd.DataFrame], pd.DataFrame]
+    colunas_alternativas: Sequence[Sequence[str]] = field(default_factory=list)
+    fuso: Optional[str] = None
+
+    def reconhece(self, header: Sequence[str]) -> bool:
+        cols = set(header)
+        if not set(self.assinatura) <= cols:
+            return False
+        return all(any(c in cols for c in grupo) for grupo in self.colunas_alternativas)
+
+    def ler(self, file_path: str, sep: str, encoding: str, tz_fiscal: Optional[str] = None) -> pd.DataFrame:
+        df = pd.read_csv(file_path, sep=sep, dtype=self.dtypes, encoding=encoding, keep_default_na=False, na_values=[""])
+        df = self.normalizar(df)
+        if "Ext" not in df.columns:
+            df["Ext"] = False
+        epoch = tempo.converter_fuso(df["Epoch"].to_numpy(), self.fuso, tz_fiscal)
+        df["Epoch"] = epoch
+        df["Timestamp"] = tempo.para_timestamp(epoch).to_numpy()
+        df["Hora"] = tempo.formatar(epoch, "%H:%M:%S")
+        df["Exchange"] = self.nome
+        return df[COLUNAS_EVENTOS]
+
+
+ADAPTADORES: Dict[str, Adaptador] = {}
+
+
+def registrar_adaptador(adaptador: Adaptador) -> Adaptador:
+    ADAPTADORES[adaptador.nome] = adaptador
+    return adaptador
+
+
+# --- BitcoinTrade ---------------------------------------------------------
+
+def _normalizar_bitcointrade(df: pd.DataFrame) -> pd.DataFrame:
+    col_valor = "Quantidade" if "Quantidade" in df.columns else "Valor"
+    out = pd.DataFrame({
+        "Epoch": tempo.combinar(tempo.parse_datas(df["Data"], "%d/%m/%Y"), tempo.parse_horas(df["Hora"])),
+        "Moeda": df["Moeda"].str.strip(),
+        "Categoria": df["Categoria"],
+        "Val_Numeric": clean_val_series(df[col_valor]),
+    })
+    out["Saldo"] = clean_val_series(df["Saldo"]) if "Saldo" in df.columns else float("nan")
+    out["Custo"] = float("nan")
+    return out
+
+
+registrar_adaptador(Adaptador(
+    nome="bitcointrade",
+    assinatura=["Data", "Hora", "Moeda", "Categoria"],
+    colunas_alternativas=[["Quantidade", "Valor"]],
+    dtypes={"Data": "str", "Hora": "str", "Moeda": "str", "Categoria": "str",
+            "Quantidade": "str", "Valor": "str", "Saldo": "str"},
+    normalizar=_normalizar_bitcointrade,
+    fuso="America/Sao_Paulo",
+))
+
+
+# --- Binance (Transaction History) ---------------------------------------
+
+# Operações da Binance -> categorias no padrão BitcoinTrade
+BINANCE_OPERACOES = {
+    "Deposit": "Depósito de carteira externa",
+    "Withdraw": "Retirada para carteira externa",
+    "Fee": "Taxa sobre compra - Executora",
+    "Transaction Fee": "Taxa sobre compra - Executora",
+    "Buy": "Compra",
+    "Transaction Buy": "Compra",
+    "Transaction Revenue": "Compra",
+    "Sell": "Venda",
+    "Transaction Sold": "Venda",
+    "Transaction Spend": "Venda",
+}
+
+
+def _normalizar_binance(df: pd.DataFrame) -> pd.DataFrame:
+    moeda = _normalizar_moeda(df["Coin"])
+    val = df["Change"].astype("float64")
+
+    categoria = df["Operation"].map(BINANCE_OPERACOES)
+    # Operações sem mapeamento explícito: decide pelo sinal
+    categoria = categoria.fillna(val.gt(0).map({True: "Compra", False: "Venda"}))
+    # Depósitos de fiat entram como depósito bancário (não geram lote)
+    fiat_dep = (categoria == "Depósito de carteira externa") & moeda.isin(["Real Brasileiro", "Euro", "US Dollar"])
+    categoria = categoria.mask(fiat_dep, "Depósito bancário")
+
+    return pd.DataFrame({
+        "Epoch": tempo.parse_timestamps(df["UTC_Time"], "%Y-%m-%d %H:%M:%S"),
+        "Moeda": moeda,
+        "Categoria": categoria,
+        "Val_Numeric": val,
+        "Saldo": float("nan"),
+        "Custo": float("nan"),
+    })
+
+
+registrar_adaptador(Adaptador(
+    nome="binance",
+    assinatura=["UTC_Time", "Operation", "Coin", "Change"],
+    dtypes={"UTC_Time": "str", "Account": "str", "Operation": "str", "Coin": "str",
+            "Change": "float64", "Remark": "str"},
+    normalizar=_normalizar_binance,
+    fuso="UTC",
+))
+
+
+# --- Estado de inventário (lotes transferidos entre exchanges) ------------
+
+def _numeros_inventario(s: pd.Series, coluna: str) -> pd.Series:
+    """
+    Números do arquivo de inventário, gravados pelo motor ("0,0112", "3,16e-06").
+    Ao contrário de clean_val_series aceita expoente, e um valor que não é
+    número interrompe a carga em vez de virar 0.0.
+    """
+    txt = s.astype("string").str.strip()
+    ambos = txt.str.contains(",", regex=False) & txt.str.contains(".", regex=False)
+    txt = txt.where(~ambos.fillna(False), txt.str.replace(".", "", regex=False))
+    num = pd.to_numeric(txt.str.replace(",", ".", regex=False), errors="coerce")
+    invalidos = txt[num.isna()]
+    if len(invalidos):
+        exemplos = ", ".join(repr(v) for v in invalidos.head(5).fillna("").tolist())
+        raise ValueError(f"{len(invalidos)} valor(es) inválido(s) na coluna {coluna} do inventário: {exemplos}")
+    return num.astype("float64")
+
+
+def _normalizar_inventario(df: pd.DataFrame) -> pd.DataFrame:
+    custo = _numeros_inventario(df["Custo"], "Custo")
+    # Origem externa: coluna Ext (Sim/Não) quando existe; sem ela, um lote com
+    # custo 0 é tratado como depósito externo (Isento_365d = TBD, como no motor)
+    if "Ext" in df.columns:
+        ext = df["Ext"].astype(str).str.strip().str.lower().isin(["sim", "s", "1", "true"])
+    else:
+        ext = custo == 0
+    return pd.DataFrame({
+        "Epoch": tempo.parse_datas(df["Data"], "%Y-%m-%d"),
+        "Moeda": _normalizar_moeda(df["Moeda"]),
+        "Categoria": "Saldo Transferido",
+        "Val_Numeric": _numeros_inventario(df["Qtd"], "Qtd"),
+        "Saldo": float("nan"),
+        "Custo": custo,
+        "Ext": ext.to_numpy(),
+    })
+
+
+registrar_adaptador(Adaptador(
+    nome="inventario",
+    assinatura=["Moeda", "Qtd", "Custo", "Data"],
+    dtypes={"Moeda": "str", "Qtd": "str", "Custo": "str", "Data": "str", "Ext": "str"},
+    normalizar=_normalizar_inventario,
+))
+
+
+# --- Detecção e carga ----------------------------------------------------
+
+def detectar_formato(file_path: str):
+    """
+    Lê o primeiro KB do arquivo e devolve (adaptador, sep, encoding).
+    """
+    with open(file_path, "rb") as fh:
+        raw = fh.read(SAMPLE_BYTES)
+
+    encoding = "utf-8-sig" if raw.startswith(b"\xef\xbb\xbf") else "utf-8"
+    try:
+        sample = raw.decode(encoding)
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+        sample = raw.decode(encoding)
+
+    # Descarta a última linha (provavelmente truncada pelo corte de 1 KB)
+    linhas = sample.splitlines()
+    if len(linhas) > 1 and not sample.endswith(("\n", "\r")):
+        linhas = linhas[:-1]
+    sample = "\n".join(linhas)
+
+    try:
+        sep = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+    except csv.Error:
+        sep = ";"
+
+    header = next(csv.reader(io.StringIO(sample), delimiter=sep), [])
+    header = [h.strip() for h in header]
+
+    for adaptador in ADAPTADORES.values():
+        if adaptador.reconhece(header):
+            return adaptador, sep, encoding
+
+    raise ValueError(f"Formato de extrato não reconhecido em {file_path}: {header}")
+
+
+def ler_extrato(file_path: str, adaptador: Optional[str] = None, tz_fiscal: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lê um extrato de qualquer formato registrado e devolve a tabela de eventos.
+    """
+    ad, sep, encoding = detectar_formato(file_path)
+    if adaptador is not None:
+        ad = ADAPTADORES[adaptador]
+    return ad.ler(file_path, sep, encoding, tz_fiscal)
+
+
+def carregar_eventos(paths: Union[str, List[str]], tz_fiscal: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lê um ou mais extratos (formatos podem ser diferentes) e junta tudo numa
+    única tabela de eventos, pronta para o replay FIFO.
+
+    tz_fiscal: fuso para o qual todos os horários são convertidos (ex.:
+    "Europe/Lisbon"). Sem ele, cada extrato mantém o relógio local de origem,
+    exceto quando os extratos vêm de fusos diferentes: aí tudo é convertido
+    para o fuso do primeiro extrato que declara fuso, para que a ordem FIFO
+    entre exchanges seja a real.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    detectados = [detectar_formato(p) for p in paths]
+    fusos = [ad.fuso for ad, _, _ in detectados if ad.fuso]
+    if tz_fiscal is None and len(set(fusos)) > 1:
+        tz_fiscal = fusos[0]
+
+    frames = [ad.ler(p, sep, encoding, tz_fiscal) for p, (ad, sep, encoding) in zip(paths, detectados)]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    for col in ["Moeda", "Exchange"]:
+        df[col] = df[col].astype("category")
+    return df
@@ -0,0 +1,248 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Casamento de pernas: cada saída (perna negativa) é emparelhada com a(s)
+# entrada(s) que a pagaram, em vez de usar a primeira moeda que entrou no
+# segundo e a soma de tudo o que entrou.
+#
+# Por janela (um segundo, ou vários com janela > 0) o casamento é feito perna
+# a perna, por classes: primeiro compras (saída fiat -> entrada cripto), depois
+# vendas (saída cripto -> entrada fiat), depois swaps cripto <-> cripto e por
+# fim o que sobrar (fiat <-> fiat). Dentro de cada classe:
+#   1. Com o mesmo número de pernas dos dois lados, o casamento é 1:1 pela
+#      ordem do extrato (fills de order book), desde que os preços implícitos
+#      dos pares de um mesmo ativo fiquem a menos de tol_preco da média deles.
+#   2. Senão, o lado com um único ativo (em geral o fiat) é a âncora: o total
+#      dele é repartido pelas pernas do outro lado em proporção ao valor de
+#      cada uma. Com um só ativo do outro lado o valor é a quantidade (rateio
+#      simples); com vários, o valor vem do último preço conhecido de cada
+#      ativo (pares já casados) e o que faltar é repartido pela ordem do
+#      extrato. Nunca em partes iguais.
+#   3. Com vários ativos dos dois lados, cada perna de entrada fica com o ativo
+#      da saída na mesma posição e o passo 2 corre por ativo de saída.
+# Cada perna é visitada um número constante de vezes por ativo do segundo,
+# por isso o custo é linear no número de eventos.
+#
+# Ficam fora do casamento: taxas, depósitos, retiradas e lotes transferidos
+# com custo conhecido. Saídas sem par ficam com "Carteira Externa" e 0.0,
+# como no motor v6. A coluna Janela marca as pernas casadas com pernas de
+# outro segundo (o verificador não confere o custo desses segundos).
+
+SEM_PAR = "Carteira Externa"
+
+
+class _Casamento:
+    """Arrays do extrato e preços de referência usados pelo casamento de uma chamada."""
+
+    def __init__(self, moeda, val, contra, valor, fiat: set, tol_preco: float):
+        self.moeda, self.val, self.contra, self.valor = moeda, val, contra, valor
+        self.fiat = fiat
+        self.tol_preco = tol_preco
+        self.precos: Dict[Tuple[str, str], float] = {}  # (ativo, unidade) -> unidades por ativo
+
+    def preco(self, ativo: str, unidade: str) -> Optional[float]:
+        p = self.precos.get((ativo, unidade))
+        if p is None and (unidade, ativo) in self.precos:
+            p = 1.0 / self.precos[(unidade, ativo)]
+        if p is None:
+            # Cripto contra cripto: pelo preço dos dois num fiat comum
+            for (a, f), pa in self.precos.items():
+                if a == ativo and (unidade, f) in self.precos:
+                    return pa / self.precos[(unidade, f)]
+        return p
+
+    def registrar_preco(self, ativo: str, unidade: str, qtd: float, total: float) -> None:
+        if qtd > 0 and total > 0:
+            self.precos[(ativo, unidade)] = total / qtd
+
+    def parear(self, i: int, j: int) -> None:
+        """Saída i <-> entrada j, 1:1."""
+        moeda, val = self.moeda, self.val
+        self.contra[i], self.valor[i] = moeda[j], val[j]
+        self.contra[j], self.valor[j] = moeda[i], -val[i]
+
+
+def _uma_a_uma(cas: _Casamento, outs: List[int], ins: List[int]) -> bool:
+    """Casa 1:1 pela ordem se os preços de cada par de ativos forem coerentes."""
+    moeda, val = cas.moeda, cas.val
+    if len(outs) != len(ins):
+        return False
+    por_par: Dict[Tuple[str, str], List[float]] = {}
+    for i, j in zip(outs, ins):
+        if moeda[i] == moeda[j] or val[j] <= 0 or val[i] >= 0:
+            return False
+        por_par.setdefault((moeda[i], moeda[j]), []).append(val[j] / -val[i])
+    for precos in por_par.values():
+        medio = sum(precos) / len(precos)
+        if any(abs(p / medio - 1.0) > cas.tol_preco for p in precos):
+            return False
+    totais: Dict[Tuple[str, str], List[float]] = {}
+    for i, j in zip(outs, ins):
+        cas.parear(i, j)
+        t = totais.setdefault((moeda[i], moeda[j]), [0.0, 0.0])
+        t[0] -= val[i]
+        t[1] += val[j]
+    for (a, b), (q_a, q_b) in totais.items():
+        if a in cas.fiat and b not in cas.fiat:
+            cas.registrar_preco(b, a, q_b, q_a)
+        else:
+            cas.registrar_preco(a, b, q_a, q_b)
+    return True
+
+
+def _por_valor(cas: _Casamento, ancora: List[int], outras: List[int]) -> None:
+    """
+    Reparte o total da âncora (um só ativo) pelas outras pernas em proporção
+    ao valor de cada uma, medido na unidade da âncora.
+    """
+    moeda, val, contra, valor = cas.moeda, cas.val, cas.contra, cas.valor
+    unidade = moeda[ancora[0]]
+    total = sum(abs(val[r]) for r in ancora)
+    qtd_ativo: Dict[str, float] = {}
+    for k in outras:
+        qtd_ativo[moeda[k]] = qtd_ativo.get(moeda[k], 0.0) + abs(val[k])
+
+    if len(qtd_ativo) == 1:
+        valor_ativo = {a: total for a in qtd_ativo}
+    else:
+        valor_ativo = {}
+        sem_preco = []
+        for a, q in qtd_ativo.items():
+            p = cas.preco(a, unidade)
+            if p is None:
+                sem_preco.append(a)
+            else:
+                valor_ativo[a] = q * p
+        conhecido = sum(valor_ativo.values())
+        if sem_preco:
+            # Ativos sem preço de referência ficam com o que sobra, repartido
+            # pela perna da âncora na mesma posição do extrato
+            if conhecido > total:
+                valor_ativo = {a: v * total / conhecido for a, v in valor_ativo.items()}
+                conhecido = total
+            peso = {a: 0.0 for a in sem_preco}
+            for pos, k in enumerate(outras):
+                if moeda[k] in peso:
+                    peso[moeda[k]] += abs(val[ancora[min(pos, len(ancora) - 1)]])
+            soma_peso = sum(peso.values())
+            for a in sem_preco:
+                valor_ativo[a] = (total - conhecido) * peso[a] / soma_peso if soma_peso > 0 else 0.0
+        elif conhecido > 0:
+            valor_ativo = {a: v * total / conhecido for a, v in valor_ativo.items()}
+
+    for k in outras:
+        a = moeda[k]
+        contra[k] = unidade
+        valor[k] = valor_ativo[a] * abs(val[k]) / qtd_ativo[a] if qtd_ativo[a] > 0 else 0.0
+    # Cada perna da âncora aponta para o ativo em que foi gasto mais valor
+    principal = max(valor_ativo, key=lambda a: valor_ativo[a])
+    for r in ancora:
+        contra[r] = principal
+        valor[r] = qtd_ativo[principal] * abs(val[r]) / total if total > 0 else 0.0
+    if len(qtd_ativo) == 1:
+        if unidade in cas.fiat or principal not in cas.fiat:
+            cas.registrar_preco(principal, unidade, qtd_ativo[principal], total)
+        else:
+            cas.registrar_preco(unidade, principal, total, qtd_ativo[principal])
+
+
+def _repartir(cas: _Casamento, outs: List[int], ins: List[int]) -> None:
+    if _uma_a_uma(cas, outs, ins):
+        return
+    moeda = cas.moeda
+    ativos_out = {moeda[i] for i in outs}
+    ativos_in = {moeda[j] for j in ins}
+    if len(ativos_out) == 1:
+        outras = [j for j in ins if moeda[j] not in ativos_out]
+        if outras:
+            _por_valor(cas, outs, outras)
+    elif len(ativos_in) == 1:
+        outras = [i for i in outs if moeda[i] not in ativos_in]
+        if outras:
+            _por_valor(cas, ins, outras)
+    else:
+        grupos: Dict[str, List[int]] = {}
+        for pos, j in enumerate(ins):
+            grupos.setdefault(moeda[outs[min(pos, len(outs) - 1)]], []).append(j)
+        for a, ins_a in grupos.items():
+            _repartir(cas, [i for i in outs if moeda[i] == a], ins_a)
+
+
+def _casar(cas: _Casamento, outs: List[int], ins: List[int]) -> Tuple[List[int], List[int]]:
+    """Casa as pernas de uma janela. Devolve (saídas sem par, entradas sem par)."""
+    moeda, contra, fiat = cas.moeda, cas.contra, cas.fiat
+    classes = [
+        (lambda a: a in fiat, lambda b: b not in fiat),        # compras
+        (lambda a: a not in fiat, lambda b: b in fiat),        # vendas
+        (lambda a: a not in fiat, lambda b: b not in fiat),    # swaps
+        (lambda a: True, lambda b: True),                      # o que sobrar
+    ]
+    for lado_out, lado_in in classes:
+        o = [i for i in outs if contra[i] is None and lado_out(moeda[i])]
+        n = [j for j in ins if contra[j] is None and lado_in(moeda[j])]
+        if o and n:
+            _repartir(cas, o, n)
+    return [i for i in outs if contra[i] is None], [j for j in ins if contra[j] is None]
+
+
+def casar_contrapartes(df: pd.DataFrame, janela: int = 0, fiat: Optional[Iterable[str]] = None,
+                       tol_preco: float = 0.02) -> pd.DataFrame:
+    """
+    Acrescenta Contraparte (ativo) e Valor_Contraparte (quantidade do outro
+    lado, positiva) a cada perna de troca. df tem de estar ordenado por Epoch.
+
+    janela: segundos extra em que uma perna sem par ainda pode casar com
+    pernas de segundos seguintes (0 = só dentro do mesmo segundo).
+    tol_preco: desvio relativo máximo entre o preço de um par 1:1 e o preço
+    médio dos pares do mesmo ativo; acima disso a ordem do extrato não é de
+    confiança.
+    """
+    fiat = set(fiat) if fiat is not None else {'Real Brasileiro', 'BRL', 'Euro', 'EUR', 'US Dollar', 'USD'}
+    n = len(df)
+    epoch = df['Epoch'].to_numpy()
+    moeda = df['Moeda'].astype(object).to_numpy()
+    val = df['Val_Numeric'].to_numpy(dtype='float64')
+    cat = df['Categoria'].astype(str)
+    fora = (cat.str.contains('Taxa', regex=False) | cat.str.contains('Depósito', regex=False)
+            | cat.str.contains('Retirada', regex=False) | df['Custo'].notna()).to_numpy()
+
+    contra = np.full(n, None, dtype=object)
+    valor = np.full(n, np.nan)
+    janela_usada = np.zeros(n, dtype=bool)
+    cas = _Casamento(moeda, val, contra, valor, fiat, tol_preco)
+
+    inicio = np.flatnonzero(np.r_[True, epoch[1:] != epoch[:-1]]) if n else np.array([], dtype=int)
+    fim = np.r_[inicio[1:], n]
+    pend_out: List[Tuple[int, int]] = []  # (epoch, índice)
+    pend_in: List[Tuple[int, int]] = []
+
+    for a, b in zip(inicio, fim):
+        ep = epoch[a]
+        outs = [i for i in range(a, b) if not fora[i] and val[i] < 0]
+        ins = [i for i in range(a, b) if not fora[i] and val[i] > 0]
+        sem_out, sem_in = _casar(cas, outs, ins) if outs and ins else (outs, ins)
+
+        if janela > 0:
+            pend_out = [(e, i) for e, i in pend_out if ep - e <= janela and contra[i] is None]
+            pend_in = [(e, j) for e, j in pend_in if ep - e <= janela and contra[j] is None]
+            if (pend_out and sem_in) or (pend_in and sem_out):
+                cand_out = [i for _, i in pend_out] + sem_out
+                cand_in = [j for _, j in pend_in] + sem_in
+                _casar(cas, cand_out, cand_in)
+                for k in cand_out + cand_in:
+                    if contra[k] is not None:
+                        janela_usada[k] = True
+            pend_out += [(ep, i) for i in sem_out if contra[i] is None]
+            pend_in += [(ep, j) for j in sem_in if contra[j] is None]
+
+    saidas = val < 0
+    contra[saidas & pd.isna(contra)] = SEM_PAR
+    valor[saidas & np.isnan(valor)] = 0.0
+
+    df = df.copy()
+    df['Contraparte'] = contra
+    df['Valor_Contraparte'] = valor
+    df['Janela'] = janela_usada
+    return df
@@ -0,0 +1,399 @@
+import argparse
+import copy
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import queue
+import select
+import statistics
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Modo daemon: observa uma pasta onde os extratos são colocados ao longo do
+# dia e mantém o estado FIFO de cada conta em memória. Cada subpasta da pasta
+# observada é uma conta (arquivos soltos na raiz vão para a conta "geral").
+# Os relatórios de cada conta são gravados em <saida>/<conta>/.
+#
+# Arquivos novos com eventos posteriores ao último já processado são
+# aplicados de forma incremental sobre o estado quente; arquivos reescritos
+# ou com eventos anteriores provocam um replay completo da conta.
+#
+# As exportações das exchanges são cumulativas: um extrato completo colocado ao
+# lado de extratos parciais repete os mesmos eventos. Um evento (Epoch, Moeda,
+# Categoria, Val_Numeric, Saldo) só é acrescentado à conta as vezes que aparece
+# a mais do que nos arquivos já lidos.
+
+EXTENSOES = (".csv",)
+CONTA_RAIZ = "geral"
+CHAVE_EVENTO = ["Epoch", "Moeda", "Categoria", "Val_Numeric", "Saldo"]
+
+# Constantes do inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENTO = struct.Struct("iIII")
+
+
+class ObservadorInotify:
+    """inotify via ctypes (Linux); sem dependências externas."""
+
+    def __init__(self, raiz: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify indisponível")
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self._dirs: Dict[int, str] = {}
+        for d, _, _ in os.walk(raiz):
+            self._adicionar(d)
+
+    def _adicionar(self, d: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(d), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch falhou em {d}")
+        self._dirs[wd] = d
+
+    def esperar(self, timeout: float) -> List[str]:
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if not prontos:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        i = 0
+        while i + _EVENTO.size <= len(buf):
+            wd, mask, _, tam = _EVENTO.unpack_from(buf, i)
+            nome = buf[i + _EVENTO.size:i + _EVENTO.size + tam].rstrip(b"\0")
+            i += _EVENTO.size + tam
+            path = os.path.join(self._dirs.get(wd, ""), os.fsdecode(nome))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._adicionar(path)
+                    # arquivos que já estavam lá antes do watch
+                    paths.extend(os.path.join(path, f) for f in os.listdir(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                paths.append(path)
+        return paths
+
+    def fechar(self) -> None:
+        os.close(self.fd)
+
+
+class ObservadorPolling:
+    """Alternativa portátil: compara (tamanho, mtime) a cada intervalo.
+    Um arquivo só é entregue quando o tamanho estabiliza entre duas leituras."""
+
+    def __init__(self, raiz: str, intervalo: float = 1.0):
+        self.raiz = raiz
+        self.intervalo = intervalo
+        self._vistos: Dict[str, Tuple[int, float]] = {}
+        self._pendentes: Dict[str, Tuple[int, float]] = {}
+        self._varrer()  # estado inicial (os arquivos existentes são tratados pelo daemon)
+        self._vistos.update(self._pendentes)
+        self._pendentes.clear()
+
+    def _varrer(self) -> List[str]:
+        prontos = []
+        for d, _, nomes in os.walk(self.raiz):
+            for n in nomes:
+                p = os.path.join(d, n)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                assinatura = (st.st_size, st.st_mtime)
+                if self._vistos.get(p) == assinatura:
+                    continue
+                if self._pendentes.get(p) == assinatura:
+                    prontos.append(p)
+                    self._vistos[p] = assinatura
+                    del self._pendentes[p]
+                else:
+                    self._pendentes[p] = assinatura
+        return prontos
+
+    def esperar(self, timeout: float) -> List[str]:
+        time.sleep(min(timeout, self.intervalo))
+        return self._varrer()
+
+    def fechar(self) -> None:
+        pass
+
+
+def criar_observador(raiz: str, polling: bool = False, intervalo: float = 1.0):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return ObservadorInotify(raiz)
+        except OSError as e:
+            print(f"inotify indisponível ({e}); usando polling")
+    return ObservadorPolling(raiz, intervalo)
+
+
+class Conta:
+    """Estado FIFO quente de uma conta e o que já foi lido de cada arquivo."""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.lock = threading.Lock()
+        self.estado = None
+        self.eventos = None  # todos os eventos da conta (para replays completos)
+        self.arquivos: Dict[str, Tuple[int, str, int]] = {}  # path -> (bytes, sha256, linhas)
+        # Sem --tz-fiscal, a conta fica no fuso do primeiro extrato que declara
+        # fuso, para não misturar relógios de exchanges diferentes
+        self.fuso: Optional[str] = None
+
+
+def _sha256(path: str, limite: Optional[int] = None) -> str:
+    h = hashlib.sha256()
+    restante = limite
+    with open(path, "rb") as fh:
+        while restante is None or restante > 0:
+            bloco = fh.read(1 << 20 if restante is None else min(1 << 20, restante))
+            if not bloco:
+                break
+            h.update(bloco)
+            if restante is not None:
+                restante -= len(bloco)
+    return h.hexdigest()
+
+
+class Daemon:
+    def __init__(self, raiz: str, saida: str, workers: int = 2, tz_fiscal: Optional[str] = None,
+                 verificar: Optional[str] = None, compactar_lotes: bool = False, polling: bool = False,
+                 intervalo: float = 1.0, max_fila: int = 100):
+        # Importados aqui para a inicialização do processo não pagar o pandas duas vezes
+        import pandas as pd
+        import Motor_BitcoinTrade_v4 as motor
+        from adaptadores import detectar_formato, ler_extrato
+
+        self.pd = pd
+        self.motor = motor
+        self.ler_extrato = ler_extrato
+        self.detectar_formato = detectar_formato
+        self.raiz = os.path.abspath(raiz)
+        self.saida = os.path.abspath(saida)
+        self.tz_fiscal = tz_fiscal
+        self.verificar = verificar
+        self.compactar_lotes = compactar_lotes
+        self.polling = polling
+        self.intervalo = intervalo
+        self.fila: "queue.Queue[Optional[Tuple[str, float]]]" = queue.Queue(maxsize=max_fila)
+        self.n_workers = max(1, workers)
+        self.contas: Dict[str, Conta] = {}
+        self._contas_lock = threading.Lock()
+        self._parar = threading.Event()
+        self.latencias: List[float] = []
+
+    # --- roteamento -----------------------------------------------------------
+
+    def _conta_de(self, path: str) -> str:
+        rel = os.path.relpath(path, self.raiz)
+        partes = rel.split(os.sep)
+        return partes[0] if len(partes) > 1 else CONTA_RAIZ
+
+    def _conta(self, nome: str) -> Conta:
+        with self._contas_lock:
+            if nome not in self.contas:
+                self.contas[nome] = Conta(nome)
+            return self.contas[nome]
+
+    def enfileirar(self, path: str) -> None:
+        if not path.lower().endswith(EXTENSOES) or os.path.basename(path).startswith("."):
+            return
+        try:
+            chegada = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return
+        self.fila.put((path, chegada))  # bloqueia se a fila estiver cheia (backpressure)
+
+    # --- processamento ------------------------------------------------------------
+
+    def _novo_estado(self):
+        return self.motor.EstadoFIFO(self.verificar, compactar_lotes=self.compactar_lotes)
+
+    def processar_arquivo(self, path: str, chegada: float) -> None:
+        conta = self._conta(self._conta_de(path))
+        with conta.lock:
+            tamanho = os.path.getsize(path)
+            anterior = conta.arquivos.get(path)
+            novos, completo, registro = self._ler_novos(conta, path, tamanho, anterior)
+            if novos is None:
+                return
+
+            eventos = conta.eventos
+            if eventos is not None and completo:
+                eventos = eventos[eventos["Fonte"] != path]
+            novos = self._sem_repetidos(eventos, novos)
+            if novos.empty and not completo:
+                conta.arquivos[path] = registro
+                print(f"[{conta.nome}] {os.path.basename(path)}: nenhum evento novo (já lidos de outro arquivo)", flush=True)
+                return
+
+            # O estado da conta (eventos, arquivos lidos) só é atualizado depois
+            # de os relatórios estarem gravados; se o replay falhar, o próximo
+            # evento do arquivo volta a processá-lo.
+            try:
+                novos = self.motor.preparar_eventos(novos)
+                if eventos is None or eventos.empty:
+                    eventos = novos
+                else:
+                    eventos = self.pd.concat([eventos, novos], ignore_index=True)
+
+                estado = conta.estado
+                incremental = (not completo and estado is not None and not novos.empty
+                               and (estado.ultimo_epoch is None or novos["Epoch"].min() > estado.ultimo_epoch))
+                if incremental:
+                    self.motor.replay_v6(novos, estado)
+                    modo = "incremental"
+                else:
+                    estado = self._novo_estado()
+                    self.motor.replay_v6(self.motor.preparar_eventos(eventos), estado)
+                    modo = "replay completo"
+
+                destino = os.path.join(self.saida, conta.nome)
+                os.makedirs(destino, exist_ok=True)
+                self.motor.gravar_relatorios(estado, destino)
+                if estado.verificador:
+                    # Verificações de fim de execução em uma cópia: o verificador quente
+                    # continua acumulando nos próximos incrementos
+                    verificador = copy.deepcopy(estado.verificador)
+                    verificador.finalizar(estado.inventory, estado.ultimo_quando)
+                    verificador.salvar(os.path.join(destino, 'Arquivo4_Invariantes.csv'),
+                                       os.path.join(destino, 'Arquivo4_Invariantes_Resumo.csv'))
+            except Exception:
+                conta.estado = None  # um replay incremental pode ter ficado pela metade
+                raise
+
+            conta.eventos = eventos
+            conta.estado = estado
+            conta.arquivos[path] = registro
+
+        latencia = time.time() - chegada
+        self.latencias.append(latencia)
+        print(f"[{conta.nome}] {os.path.basename(path)}: {len(novos)} eventos ({modo}) | "
+              f"IRS {len(estado.log_irs)} Swaps {len(estado.log_swaps)} Recon {len(estado.log_recon)} | "
+              f"chegada -> relatório {latencia * 1000:.0f} ms", flush=True)
+
+    def _sem_repetidos(self, eventos, novos):
+        """Tira de novos as ocorrências de eventos que a conta já tem (de outros arquivos)."""
+        if eventos is None or eventos.empty or novos.empty:
+            return novos
+        ja_lidos = eventos.groupby(CHAVE_EVENTO, dropna=False, sort=False).size().rename("_ja_lidos")
+        ja = novos[CHAVE_EVENTO].merge(ja_lidos, left_on=CHAVE_EVENTO, right_index=True, how="left")["_ja_lidos"]
+        ocorrencia = novos.groupby(CHAVE_EVENTO, dropna=False, sort=False).cumcount()
+        return novos[ocorrencia.to_numpy() >= ja.fillna(0).to_numpy()]
+
+    def _ler_novos(self, conta: Conta, path: str, tamanho: int, anterior):
+        """
+        Devolve (eventos novos, completo, registro). completo=True quando o
+        arquivo foi reescrito e todos os seus eventos substituem os anteriores.
+        registro é o que fica em conta.arquivos depois de processado.
+        """
+        if anterior is not None:
+            bytes_ant, hash_ant, linhas_ant = anterior
+            if tamanho == bytes_ant and _sha256(path) == hash_ant:
+                return None, False, None  # nada mudou
+            acrescentado = tamanho > bytes_ant and _sha256(path, bytes_ant) == hash_ant
+        else:
+            acrescentado = False
+
+        try:
+            if self.tz_fiscal is None and conta.fuso is None:
+                conta.fuso = self.detectar_formato(path)[0].fuso
+            df = self.ler_extrato(path, tz_fiscal=self.tz_fiscal or conta.fuso)
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"[{conta.nome}] {os.path.basename(path)} ignorado: {e}", flush=True)
+            return None, False, None
+        df["Fonte"] = path
+        registro = (tamanho, _sha256(path), len(df))
+
+        if acrescentado:
+            return df.iloc[anterior[2]:], False, registro
+        return df, anterior is not None, registro
+
+    def _worker(self) -> None:
+        while True:
+            item = self.fila.get()
+            try:
+                if item is None:
+                    return
+                self.processar_arquivo(*item)
+            except Exception as e:  # um arquivo com problema não derruba o daemon
+                print(f"Erro ao processar {item[0]}: {e}", flush=True)
+            finally:
+                self.fila.task_done()
+
+    # --- ciclo principal ------------------------------------------------------------
+
+    def executar(self, duracao: Optional[float] = None) -> None:
+        os.makedirs(self.saida, exist_ok=True)
+        observador = criar_observador(self.raiz, self.polling, self.intervalo)
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.n_workers)]
+        for w in workers:
+            w.start()
+        print(f"Observando {self.raiz} ({type(observador).__name__}, {self.n_workers} workers)", flush=True)
+
+        # Arquivos que já estavam na pasta, por ordem de mtime
+        existentes = [os.path.join(d, n) for d, _, ns in os.walk(self.raiz) for n in ns]
+        for p in sorted(existentes, key=os.path.getmtime):
+            self.enfileirar(p)
+
+        fim = time.time() + duracao if duracao else None
+        try:
+            while not self._parar.is_set() and (fim is None or time.time() < fim):
+                for p in observador.esperar(self.intervalo):
+                    self.enfileirar(p)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.fila.join()
+            for _ in workers:
+                self.fila.put(None)
+            for w in workers:
+                w.join()
+            observador.fechar()
+            if self.latencias:
+                print(f"{len(self.latencias)} arquivos processados | "
+                      f"latência mediana {statistics.median(self.latencias) * 1000:.0f} ms, "
+                      f"máx {max(self.latencias) * 1000:.0f} ms", flush=True)
+
+    def parar(self) -> None:
+        self._parar.set()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Processa extratos à medida que chegam a uma pasta.")
+    parser.add_argument("pasta", help="Pasta observada (uma subpasta por conta).")
+    parser.add_argument("--saida", default="relatorios", help="Pasta dos relatórios (uma subpasta por conta).")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-fila", type=int, default=100)
+    parser.add_argument("--polling", action="store_true", help="Força o polling em vez do inotify.")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre varreduras (polling).")
+    parser.add_argument("--tz-fiscal")
+    parser.add_argument("--verificar", choices=["completo", "amostragem", "checkpoint"])
+    parser.add_argument("--compactar-lotes", action="store_true")
+    parser.add_argument("--duracao", type=float, help="Termina após N segundos (por padrão roda até Ctrl+C).")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.pasta):
+        print(f"Erro: pasta {args.pasta} não encontrada!")
+        return 1
+
+    Daemon(args.pasta, args.saida, args.workers, args.tz_fiscal, args.verificar, args.compactar_lotes,
+           args.polling, args.intervalo, args.max_fila).executar(args.duracao)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
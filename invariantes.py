@@ -0,0 +1,288 @@
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+FIAT_PADRAO = {'Real Brasileiro', 'BRL', 'Euro', 'EUR', 'US Dollar', 'USD'}
+
+MODOS = ("completo", "amostragem", "checkpoint")
+
+
+def _arred(x: float, casas: int = 8) -> float:
+    # Somas em bloco podem deixar resíduos de -1e-12: sem "-0.0" nos relatórios
+    return round(x, casas) + 0.0
+
+
+class VerificadorInvariantes:
+    """
+    Verificador opcional de conservação para o replay FIFO.
+
+    O motor passa os eventos do replay de uma vez (preparar) e chama os hooks
+    abaixo só para os lotes; as linhas do extrato não passam por nenhum hook.
+    Os fluxos e saldos por ativo são somados em bloco (np.bincount) até o
+    grupo que vai ser verificado. As verificações correm no fim de cada
+    segundo (grupo):
+      - "completo": todos os grupos
+      - "amostragem": 1 em cada `intervalo` grupos
+      - "checkpoint": só de `intervalo` em `intervalo` grupos (e no fim),
+        incluindo a soma dos lotes em aberto no inventário
+    `inventory` é o lotes.Inventario do motor.
+    Os contadores de lotes são sempre atualizados e os fluxos pendentes são
+    somados antes de cada verificação, por isso uma verificação em qualquer
+    grupo cobre o histórico completo até esse ponto.
+
+    Invariantes:
+      1. Saldo: entradas - saídas do extrato (incluindo taxas) == coluna Saldo
+      2. Quantidade: saídas do extrato == consumido dos lotes + faltas + ignorado
+         (taxas não consumidas, ativos sem inventário)
+      3. Inventário: lotes adicionados - consumidos == soma dos lotes em aberto
+      4. Custo: custo dos lotes criados num segundo == fiat pago + custo
+         transferido pelos swaps desse segundo (não verificado nos segundos
+         com pernas casadas a outro segundo, coluna Janela)
+      5. Inventário vs extrato: lotes adicionados - consumidos == saldo do
+         extrato, por ativo (nos checkpoints e no fim). Detecta inventário
+         fantasma, por exemplo taxas pagas em cripto que não consomem lotes
+    """
+
+    def __init__(self, modo: str = "completo", intervalo: int = 1000, tol: float = 1e-8,
+                 tol_saldo: float = 5e-6, tol_custo: float = 0.01, fiat: Optional[Iterable[str]] = None, max_anomalias: int = 1000):
+        if modo not in MODOS:
+            raise ValueError(f"Modo inválido: {modo} (use um de {', '.join(MODOS)})")
+        self.modo = modo
+        self.intervalo = max(1, int(intervalo))
+        self.tol = tol
+        # O extrato arredonda alguns ativos (ex.: XRP com 6 casas) na coluna Saldo
+        self.tol_saldo = tol_saldo
+        self.tol_custo = tol_custo
+        self.fiat = set(fiat) if fiat is not None else set(FIAT_PADRAO)
+        self.max_anomalias = max_anomalias
+
+        # Totais por ativo
+        self.fluxo_in: Dict[str, float] = defaultdict(float)
+        self.fluxo_out: Dict[str, float] = defaultdict(float)
+        self.lote_in: Dict[str, float] = defaultdict(float)
+        self.lote_out: Dict[str, float] = defaultdict(float)
+        self.falta_qtd: Dict[str, float] = defaultdict(float)
+        self.ignorado_qtd: Dict[str, float] = defaultdict(float)
+        self.custo_in: Dict[str, float] = defaultdict(float)
+        self.custo_out: Dict[str, float] = defaultdict(float)
+        self.saldo: Dict[str, float] = {}
+        self._divergencia: Dict[str, float] = {}  # última divergência inventário/saldo reportada
+
+        # Eventos do replay corrente (ver preparar)
+        self._moedas: List[str] = []
+        self._codigos = np.empty(0, dtype=np.intp)
+        self._val = np.empty(0)
+        self._saldo_linha = np.empty(0)
+        self._fiat_linha = np.empty(0, dtype=bool)
+        self._inicios = np.empty(0, dtype=np.intp)
+        self._fins = np.empty(0, dtype=np.intp)
+        self._custo_fora: Optional[np.ndarray] = None
+        self._grupo0 = 0
+        self._pos = 0
+
+        # Estado do grupo corrente
+        self._custo_criado = 0.0
+        self._custo_swap = 0.0
+
+        self.n_grupos = 0
+        self.n_verificacoes = 0
+        self.contagem: Dict[str, int] = defaultdict(int)
+        self.anomalias: List[Dict[str, Any]] = []
+
+    # --- hooks chamados pelo motor ---------------------------------------
+
+    def preparar(self, df: pd.DataFrame) -> None:
+        """
+        Eventos que o replay vai processar (já ordenados por Epoch, todas as
+        categorias, incluindo taxas e fiat). Cada valor distinto de Epoch é um
+        grupo, na mesma ordem das chamadas a fim_grupo.
+        """
+        self._aplicar(len(self._val))  # resto de um replay anterior (daemon)
+        epoch = df['Epoch'].to_numpy()
+        codigos, moedas = pd.factorize(df['Moeda'])
+        self._moedas = list(moedas)
+        self._codigos = codigos
+        self._val = df['Val_Numeric'].to_numpy(dtype='float64')
+        self._saldo_linha = df['Saldo'].to_numpy(dtype='float64')
+        self._fiat_linha = df['Moeda'].isin(self.fiat).to_numpy()
+        self._inicios = np.flatnonzero(np.r_[True, epoch[1:] != epoch[:-1]]) if len(epoch) else np.empty(0, dtype=np.intp)
+        self._fins = np.r_[self._inicios[1:], len(epoch)]
+        self._custo_fora = None
+        if 'Janela' in df.columns:
+            self._custo_fora = np.logical_or.reduceat(df['Janela'].to_numpy(dtype=bool), self._inicios) if len(epoch) else None
+        self._grupo0 = self.n_grupos
+        self._pos = 0
+
+    def _aplicar(self, ate: int) -> None:
+        """Soma ao saldo e aos fluxos por ativo as linhas [_pos, ate) do replay."""
+        if ate <= self._pos:
+            return
+        codigos = self._codigos[self._pos:ate]
+        val = self._val[self._pos:ate]
+        n = len(self._moedas)
+        liquido = np.bincount(codigos, weights=val, minlength=n)
+        entradas = np.bincount(codigos, weights=np.where(val > 0, val, 0.0), minlength=n)
+        for k in np.flatnonzero(np.bincount(codigos, minlength=n)):
+            moeda = self._moedas[k]
+            if moeda not in self.saldo:
+                # Primeiro evento do ativo: saldo anterior implícito no extrato
+                i = self._pos + int(np.argmax(codigos == k))
+                inicial = 0.0 if math.isnan(self._saldo_linha[i]) else self._saldo_linha[i] - self._val[i]
+                self.saldo[moeda] = inicial
+                if abs(inicial) > self.tol_saldo:
+                    self._anomalia(None, moeda, "SALDO INICIAL", 0.0, inicial,
+                                   "Extrato começa com saldo; lotes anteriores desconhecidos")
+            self.saldo[moeda] += liquido[k]
+            self.fluxo_in[moeda] += entradas[k]
+            self.fluxo_out[moeda] += entradas[k] - liquido[k]
+        self._pos = ate
+
+    def lote_adicionado(self, moeda: str, qtd: float, custo: float, comprado: bool = True) -> None:
+        """comprado=False para depósitos externos e lotes transferidos (custo não vem do segundo)."""
+        self.lote_in[moeda] += qtd
+        self.custo_in[moeda] += custo
+        if comprado:
+            self._custo_criado += custo
+
+    def lote_consumido(self, moeda: str, qtd: float, custo: float, swap: bool = False) -> None:
+        self.lote_out[moeda] += qtd
+        self.custo_out[moeda] += custo
+        if swap:
+            self._custo_swap += custo
+
+    def falta(self, quando: str, moeda: str, qtd: float) -> None:
+        """Saída sem lotes suficientes no inventário."""
+        self.falta_qtd[moeda] += qtd
+        self._anomalia(quando, moeda, "SEM INVENTÁRIO", qtd, 0.0, "Saída maior que os lotes em aberto")
+
+    def ignorado(self, moeda: str, qtd: float) -> None:
+        """Saída do extrato que o motor não aplica ao inventário (ex.: taxas)."""
+        self.ignorado_qtd[moeda] += qtd
+
+    def fim_grupo(self, quando: str, inventory=None) -> None:
+        g = self.n_grupos - self._grupo0
+        self.n_grupos += 1
+        if self._deve_verificar():
+            self.n_verificacoes += 1
+            inicio, fim = self._inicios[g], self._fins[g]
+            self._aplicar(fim)
+            self._verificar_saldos(quando, inicio, fim)
+            # Custo pago em outro segundo (pernas casadas com janela): não se confere
+            if self._custo_fora is None or not self._custo_fora[g]:
+                self._verificar_custo(quando, inicio, fim)
+            if self.modo == "checkpoint" and inventory is not None:
+                self._verificar_inventario(quando, inventory)
+                self._verificar_inventario_saldo(quando)
+        self._custo_criado = self._custo_swap = 0.0
+
+    def finalizar(self, inventory, quando: Optional[str] = None) -> None:
+        self._aplicar(len(self._val))
+        self._verificar_inventario(quando, inventory)
+        self._verificar_inventario_saldo(quando, final=True)
+        for moeda in self._ativos():
+            contabilizado = self.lote_out[moeda] + self.falta_qtd[moeda] + self.ignorado_qtd[moeda]
+            # Entradas que não viraram lote também quebram a conservação
+            if abs(self.fluxo_in[moeda] - self.lote_in[moeda]) > self.tol:
+                self._anomalia(quando, moeda, "ENTRADA SEM LOTE", self.fluxo_in[moeda], self.lote_in[moeda],
+                               "Entradas do extrato não registradas no inventário")
+            if abs(self.fluxo_out[moeda] - contabilizado) > self.tol:
+                self._anomalia(quando, moeda, "SAÍDA NÃO CONTABILIZADA", self.fluxo_out[moeda], contabilizado,
+                               "Saídas do extrato != consumido + faltas + ignorado")
+
+    def _ativos(self) -> List[str]:
+        # Ativos que passam pelo inventário (fiat puro fica de fora)
+        return sorted(m for m in self.saldo if m not in self.fiat or self.lote_in[m] or self.lote_out[m])
+
+    # --- verificações -------------------------------------------------------
+
+    def _deve_verificar(self) -> bool:
+        if self.modo == "completo":
+            return True
+        return self.n_grupos % self.intervalo == 0
+
+    def _verificar_saldos(self, quando: str, inicio: int, fim: int) -> None:
+        saldos_grupo: Dict[str, List[float]] = {}
+        for k, s in zip(self._codigos[inicio:fim].tolist(), self._saldo_linha[inicio:fim].tolist()):
+            if not math.isnan(s):
+                saldos_grupo.setdefault(self._moedas[k], []).append(s)
+        for moeda, saldos in saldos_grupo.items():
+            atual = self.saldo[moeda]
+            # A ordem das linhas dentro do segundo não é garantida; o saldo no
+            # fim do segundo tem de coincidir com o Saldo de uma delas.
+            if min(abs(atual - s) for s in saldos) > max(self.tol_saldo, 1e-9 * abs(atual)):
+                esperado = min(saldos, key=lambda s: abs(atual - s))
+                self._anomalia(quando, moeda, "SALDO DIVERGENTE", esperado, atual,
+                               "Soma das movimentações != coluna Saldo")
+                self.saldo[moeda] = esperado  # ressincroniza para não repetir a anomalia
+
+    def _verificar_custo(self, quando: str, inicio: int, fim: int) -> None:
+        if self._custo_criado <= 0 and self._custo_swap <= 0:
+            return
+        val = self._val[inicio:fim]
+        fiat_pago = -float(val[(val < 0) & self._fiat_linha[inicio:fim]].sum())
+        esperado = fiat_pago + self._custo_swap
+        if abs(self._custo_criado - esperado) > self.tol_custo:
+            self._anomalia(quando, "", "CUSTO NÃO CONSERVADO", esperado, self._custo_criado,
+                           "Custo dos lotes criados != fiat pago + custo transferido em swaps")
+
+    def _verificar_inventario(self, quando: Optional[str], inventory) -> None:
+        for moeda, lotes in inventory.items():
+            em_aberto = lotes.qtd_total()
+            esperado = self.lote_in[moeda] - self.lote_out[moeda]
+            if abs(em_aberto - esperado) > max(self.tol, 1e-9 * abs(esperado)):
+                self._anomalia(quando, moeda, "INVENTÁRIO DIVERGENTE", esperado, em_aberto,
+                               "Lotes adicionados - consumidos != lotes em aberto")
+
+    def _verificar_inventario_saldo(self, quando: Optional[str], final: bool = False) -> None:
+        # Nos checkpoints só se reporta quando a divergência muda; no fim, sempre
+        for moeda in self._ativos():
+            inventario = self.lote_in[moeda] - self.lote_out[moeda]
+            diferenca = inventario - self.saldo[moeda]
+            if abs(diferenca) <= max(self.tol_saldo, 1e-9 * abs(self.saldo[moeda])):
+                self._divergencia.pop(moeda, None)
+                continue
+            if not final and abs(diferenca - self._divergencia.get(moeda, 0.0)) <= self.tol_saldo:
+                continue
+            self._divergencia[moeda] = diferenca
+            self._anomalia(quando, moeda, "INVENTÁRIO != SALDO", self.saldo[moeda], inventario,
+                           "Lotes em aberto != saldo do extrato (ex.: taxas que não consomem lotes)")
+
+    def _anomalia(self, quando: Optional[str], moeda: str, tipo: str, esperado: float, obtido: float, detalhe: str) -> None:
+        self.contagem[tipo] += 1
+        if len(self.anomalias) >= self.max_anomalias:
+            return
+        self.anomalias.append({
+            'Data': quando or '',
+            'Moeda': moeda, 'Tipo': tipo,
+            'Esperado': _arred(esperado, 8), 'Obtido': _arred(obtido, 8),
+            'Diferenca': _arred(obtido - esperado, 8), 'Detalhe': detalhe,
+        })
+
+    # --- relatórios -----------------------------------------------------------
+
+    def resumo_por_ativo(self) -> pd.DataFrame:
+        linhas = []
+        for moeda in self._ativos():
+            inventario = self.lote_in[moeda] - self.lote_out[moeda]
+            linhas.append({
+                'Moeda': moeda,
+                'Entradas': _arred(self.fluxo_in[moeda], 8), 'Saidas': _arred(self.fluxo_out[moeda], 8),
+                'Saldo_Extrato': _arred(self.saldo[moeda], 8), 'Saldo_Inventario': _arred(inventario, 8),
+                'Divergencia': _arred(inventario - self.saldo[moeda], 8),
+                'Ignorado': _arred(self.ignorado_qtd[moeda], 8), 'Sem_Inventario': _arred(self.falta_qtd[moeda], 8),
+                'Custo_Entrada': _arred(self.custo_in[moeda], 2), 'Custo_Saida': _arred(self.custo_out[moeda], 2),
+            })
+        return pd.DataFrame(linhas)
+
+    def salvar(self, path_anomalias: str, path_resumo: str) -> None:
+        pd.DataFrame(self.anomalias).to_csv(path_anomalias, index=False, sep=';', encoding='utf-8-sig')
+        self.resumo_por_ativo().to_csv(path_resumo, index=False, sep=';', encoding='utf-8-sig')
+
+    def __str__(self) -> str:
+        total = sum(self.contagem.values())
+        tipos = ", ".join(f"{t}: {n}" for t, n in sorted(self.contagem.items()))
+        return (f"Invariantes ({self.modo}): {self.n_verificacoes}/{self.n_grupos} grupos verificados | "
+                f"{total} anomalias" + (f" ({tipos})" if tipos else ""))
@@ -0,0 +1,217 @@
+import datetime
+import hashlib
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+# Base de dados local para auditoria. Cada execução do motor é um "run";
+# todas as tabelas levam run_id, por isso execuções posteriores são
+# acrescentadas à mesma base sem apagar as anteriores. Um run é identificado
+# pelos extratos e pelas opções do motor: as mesmas entradas com as mesmas
+# opções não são carregadas duas vezes.
+#
+# Cada run é uma fotografia completa: o replay FIFO refaz lotes e consumos
+# desde o início, por isso os eventos, lotes e consumos do run são gravados
+# inteiros, mesmo quando o extrato só cresceu desde o run anterior.
+#
+# As vistas irs e swaps mostram o run mais recente de cada conjunto de
+# extratos (coluna fontes, ver runs_recentes); consumos_lotes tem todos os
+# runs (filtrar por run_id para comparar execuções).
+#
+# Exemplo: linhas de IRS cuja aquisição veio de lotes comprados em março de 2019
+#   SELECT * FROM irs WHERE data_aquisicao BETWEEN '2019-03-01' AND '2019-03-31';
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    criado TEXT NOT NULL,
+    fontes TEXT NOT NULL,
+    hash TEXT NOT NULL UNIQUE,  -- chave_execucao: extratos + opções do motor
+    hash_entradas TEXT,
+    opcoes TEXT
+);
+CREATE TABLE IF NOT EXISTS eventos (
+    run_id INTEGER NOT NULL,
+    epoch INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    hora TEXT NOT NULL,
+    exchange TEXT,
+    moeda TEXT NOT NULL,
+    categoria TEXT,
+    valor REAL,
+    saldo REAL,
+    custo REAL
+);
+CREATE TABLE IF NOT EXISTS lotes (
+    run_id INTEGER NOT NULL,
+    lote_id INTEGER NOT NULL,
+    moeda TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    qtd REAL,
+    custo REAL,
+    ext INTEGER,
+    PRIMARY KEY (run_id, lote_id)
+);
+CREATE TABLE IF NOT EXISTS consumos (
+    run_id INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    lote_id INTEGER NOT NULL,
+    moeda TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    hora TEXT NOT NULL,
+    qtd REAL,
+    custo REAL,
+    valor_venda REAL,
+    moeda_venda TEXT,
+    destino TEXT NOT NULL,
+    dias INTEGER,
+    PRIMARY KEY (run_id, chunk_id)
+);
+CREATE TABLE IF NOT EXISTS reconciliacao (
+    run_id INTEGER NOT NULL,
+    data TEXT,
+    hora TEXT,
+    moeda TEXT,
+    qtd REAL,
+    tipo TEXT,
+    status TEXT
+);
+"""
+
+# Vistas recriadas a cada abertura, para bases criadas por versões anteriores
+VISTAS = """
+DROP VIEW IF EXISTS irs;
+DROP VIEW IF EXISTS swaps;
+DROP VIEW IF EXISTS consumos_lotes;
+DROP VIEW IF EXISTS runs_recentes;
+CREATE VIEW runs_recentes AS
+    SELECT MAX(run_id) AS run_id, fontes FROM runs GROUP BY fontes;
+CREATE VIEW consumos_lotes AS
+    SELECT c.*, l.data AS data_aquisicao, l.ext AS origem_externa,
+           ROUND(c.valor_venda - c.custo, 2) AS resultado
+    FROM consumos c JOIN lotes l ON l.run_id = c.run_id AND l.lote_id = c.lote_id;
+CREATE VIEW irs AS SELECT c.*, r.fontes FROM consumos_lotes c JOIN runs_recentes r ON r.run_id = c.run_id
+    WHERE c.destino = 'IRS';
+CREATE VIEW swaps AS SELECT c.*, r.fontes FROM consumos_lotes c JOIN runs_recentes r ON r.run_id = c.run_id
+    WHERE c.destino = 'Swap';
+"""
+
+# Criados depois da carga (índices construídos uma vez em vez de linha a linha)
+INDICES = """
+CREATE INDEX IF NOT EXISTS ix_eventos_moeda_data ON eventos (moeda, epoch);
+CREATE INDEX IF NOT EXISTS ix_eventos_run ON eventos (run_id);
+CREATE INDEX IF NOT EXISTS ix_lotes_moeda_data ON lotes (moeda, epoch);
+CREATE INDEX IF NOT EXISTS ix_lotes_data ON lotes (data);
+CREATE INDEX IF NOT EXISTS ix_consumos_lote ON consumos (run_id, lote_id);
+CREATE INDEX IF NOT EXISTS ix_consumos_moeda_data ON consumos (moeda, epoch);
+CREATE INDEX IF NOT EXISTS ix_recon_moeda_data ON reconciliacao (moeda, data);
+"""
+
+LOTE_INSERCAO = 50_000
+
+
+def hash_entradas(paths: Sequence[str]) -> str:
+    h = hashlib.sha256()
+    for p in paths:
+        with open(p, "rb") as fh:
+            for bloco in iter(lambda: fh.read(1 << 20), b""):
+                h.update(bloco)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def opcoes_motor(opcoes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Opções do motor que mudam os relatórios, normalizadas (None/False/0 quando ausentes)."""
+    opcoes = opcoes or {}
+    return {"tz_fiscal": opcoes.get("tz_fiscal") or None,
+            "compactar_lotes": bool(opcoes.get("compactar_lotes")),
+            "casar_pernas": bool(opcoes.get("casar_pernas")),
+            "janela_casamento": int(opcoes.get("janela_casamento") or 0)}
+
+
+def chave_execucao(input_hash: str, opcoes: Optional[Dict[str, Any]]) -> str:
+    texto = json.dumps(opcoes_motor(opcoes), sort_keys=True)
+    return hashlib.sha256(f"{input_hash}\0{texto}".encode()).hexdigest()
+
+
+def _migrar(con: sqlite3.Connection) -> None:
+    colunas = {r[1] for r in con.execute("PRAGMA table_info(runs)")}
+    for col in ("hash_entradas", "opcoes"):
+        if col not in colunas:
+            con.execute(f"ALTER TABLE runs ADD COLUMN {col} TEXT")
+
+
+def _inserir(con: sqlite3.Connection, tabela: str, n_colunas: int, linhas: Iterable[Sequence[Any]]) -> int:
+    sql = f"INSERT INTO {tabela} VALUES ({', '.join('?' * n_colunas)})"
+    total = 0
+    lote: List[Sequence[Any]] = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= LOTE_INSERCAO:
+            con.executemany(sql, lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        con.executemany(sql, lote)
+        total += len(lote)
+    return total
+
+
+def exportar_sqlite(
+    db_path: str,
+    fontes: Sequence[str],
+    eventos: pd.DataFrame,
+    registro_lotes: Dict[int, List[Any]],
+    consumos: List[Sequence[Any]],
+    recon: List[Dict[str, Any]],
+    input_hash: Optional[str] = None,
+    opcoes: Optional[Dict[str, Any]] = None,
+) -> Optional[int]:
+    """
+    Carrega uma execução do motor na base SQLite em uma única transação.
+    Devolve o run_id, ou None se estas entradas já tinham sido carregadas
+    com as mesmas opções (ver opcoes_motor). Os eventos são gravados todos,
+    não só os posteriores ao run anterior dos mesmos extratos.
+
+    eventos: tabela de eventos do motor (Epoch, Data_Str, Hora, Exchange, Moeda, Categoria, Val_Numeric, Saldo, Custo)
+    registro_lotes: lotes.Inventario.registro
+    consumos: (chunk_id, lote_id, moeda, epoch, data, hora, qtd, custo, valor_venda, moeda_venda, destino, dias)
+    """
+    input_hash = input_hash or hash_entradas(fontes)
+    chave = chave_execucao(input_hash, opcoes)
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.executescript(SCHEMA)
+        _migrar(con)
+        con.executescript(VISTAS)
+
+        if con.execute("SELECT 1 FROM runs WHERE hash = ?", (chave,)).fetchone():
+            return None
+
+        with con:  # transação única
+            cur = con.execute("INSERT INTO runs (criado, fontes, hash, hash_entradas, opcoes) VALUES (?, ?, ?, ?, ?)",
+                              (datetime.datetime.now().isoformat(timespec="seconds"), ";".join(fontes), chave,
+                               input_hash, json.dumps(opcoes_motor(opcoes), sort_keys=True)))
+            run_id = cur.lastrowid
+
+            cols = ["Epoch", "Data_Str", "Hora", "Exchange", "Moeda", "Categoria", "Val_Numeric", "Saldo", "Custo"]
+            ev = eventos[cols].astype({"Exchange": object, "Moeda": object})
+            ev = ev.astype(object).where(ev.notna(), None)
+            _inserir(con, "eventos", 10, ((run_id,) + t for t in ev.itertuples(index=False, name=None)))
+
+            _inserir(con, "lotes", 8, ((run_id, lote_id, *ficha) for lote_id, ficha in registro_lotes.items()))
+            _inserir(con, "consumos", 13, ((run_id, *c) for c in consumos))
+            _inserir(con, "reconciliacao", 7, (
+                (run_id, r['Data'], r['Hora'], r['Moeda'], r['Qtd'], r['Tipo'], r['Status']) for r in recon))
+
+        # executescript faz COMMIT implícito, por isso os índices ficam fora da transação de carga
+        con.executescript(INDICES)
+        return run_id
+    finally:
+        con.close()
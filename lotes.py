@@ -0,0 +1,141 @@
+from array import array
+from typing import Dict, Iterator, Tuple
+
+import pandas as pd
+
+import tempo
+
+FLAG_EXT = 1  # lote de origem externa (depósito sem custo conhecido)
+
+# Acima deste número de lotes já consumidos na cabeça, os arrays são encurtados
+_LIMITE_CABECA = 4096
+
+
+def _mesmo_preco(custo_a: float, qtd_a: float, custo_b: float, qtd_b: float) -> bool:
+    # custo_a / qtd_a == custo_b / qtd_b, sem dividir (qtd pode ser 0)
+    return abs(custo_a * qtd_b - custo_b * qtd_a) <= 1e-12 * max(abs(custo_a * qtd_b), abs(custo_b * qtd_a), 1e-300)
+
+
+class LotesAtivo:
+    """
+    Fila FIFO de lotes de um ativo guardada em arrays compactos:
+    epoch (int64), qtd/custo (float64) e flags (uint8). Consumir a cabeça é
+    O(1) (avança um índice em vez de list.pop(0)).
+
+    Com compactar=True, um lote adquirido no mesmo segundo, com a mesma origem
+    e o mesmo custo unitário que o último lote da fila é somado a ele (fills
+    de uma mesma ordem). A compactação não perde informação: a ordem FIFO, o
+    período de detenção (dias_entre) e o custo proporcional de qualquer
+    consumo são os mesmos; só o número de linhas por venda pode diminuir.
+    """
+
+    __slots__ = ("compactar", "ids", "epoch", "qtd", "custo", "flags", "head", "n_adicionados", "_datas")
+
+    def __init__(self, compactar: bool = False):
+        self.compactar = compactar
+        self.ids = array("q")
+        self.epoch = array("q")
+        self.qtd = array("d")
+        self.custo = array("d")
+        self.flags = array("B")
+        self.head = 0
+        self.n_adicionados = 0
+        self._datas: Dict[int, str] = {}  # dia -> "YYYY-MM-DD"
+
+    def __len__(self) -> int:
+        return len(self.qtd) - self.head
+
+    def adicionar(self, lote_id: int, qtd: float, custo: float, epoch: int, data_s: str, ext: bool) -> int:
+        """Devolve o id do lote que recebeu a quantidade (o anterior, se compactado)."""
+        self.n_adicionados += 1
+        dia = epoch // tempo.SEGUNDOS_DIA
+        flag = FLAG_EXT if ext else 0
+        self._datas.setdefault(dia, data_s)
+        if (self.compactar and len(self) and self.flags[-1] == flag and self.epoch[-1] == epoch
+                and _mesmo_preco(self.custo[-1], self.qtd[-1], custo, qtd)):
+            self.qtd[-1] += qtd
+            self.custo[-1] += custo
+            return self.ids[-1]
+        self.ids.append(lote_id)
+        self.epoch.append(epoch)
+        self.qtd.append(qtd)
+        self.custo.append(custo)
+        self.flags.append(flag)
+        return lote_id
+
+    def cabeca(self) -> Tuple[float, float, int, bool]:
+        """(qtd, custo, epoch, ext) do lote mais antigo."""
+        i = self.head
+        return self.qtd[i], self.custo[i], self.epoch[i], bool(self.flags[i] & FLAG_EXT)
+
+    def id_cabeca(self) -> int:
+        return self.ids[self.head]
+
+    def data_cabeca(self) -> str:
+        return self._datas[self.epoch[self.head] // tempo.SEGUNDOS_DIA]
+
+    def dias_cabeca(self, epoch_venda: int) -> int:
+        return tempo.dias_entre(self.epoch[self.head], epoch_venda)
+
+    def reduzir_cabeca(self, qtd: float, custo: float) -> None:
+        self.qtd[self.head] -= qtd
+        self.custo[self.head] -= custo
+
+    def remover_cabeca(self) -> None:
+        self.head += 1
+        if self.head >= _LIMITE_CABECA and self.head * 2 >= len(self.qtd):
+            for arr in (self.ids, self.epoch, self.qtd, self.custo, self.flags):
+                del arr[:self.head]
+            self.head = 0
+
+    def qtd_total(self) -> float:
+        return sum(self.qtd[self.head:])
+
+    def em_aberto(self) -> Iterator[Tuple[int, float, float, bool]]:
+        """(epoch, qtd, custo, ext) de cada lote em aberto, do mais antigo para o mais recente."""
+        for i in range(self.head, len(self.qtd)):
+            yield self.epoch[i], self.qtd[i], self.custo[i], bool(self.flags[i] & FLAG_EXT)
+
+    def memoria(self) -> int:
+        """Bytes ocupados pelos lotes em aberto."""
+        arrays = (self.ids, self.epoch, self.qtd, self.custo, self.flags)
+        return sum(arr.itemsize * (len(arr) - self.head) for arr in arrays)
+
+
+class Inventario(dict):
+    """
+    {moeda: LotesAtivo}. Com registrar=True guarda também a ficha de cada
+    lote criado ({lote_id: [moeda, epoch, data, qtd, custo, ext]}) para a
+    exportação da linhagem (ver ledger_db.py).
+    """
+
+    def __init__(self, compactar: bool = False, registrar: bool = False):
+        super().__init__()
+        self.compactar = compactar
+        self.registro = {} if registrar else None
+        self._proximo_id = 1
+
+    def lotes(self, moeda: str) -> LotesAtivo:
+        if moeda not in self:
+            self[moeda] = LotesAtivo(self.compactar)
+        return self[moeda]
+
+    def adicionar(self, moeda: str, qtd: float, custo: float, epoch: int, data_s: str, ext: bool) -> int:
+        lote_id = self.lotes(moeda).adicionar(self._proximo_id, qtd, custo, epoch, data_s, ext)
+        if lote_id == self._proximo_id:
+            self._proximo_id += 1
+            if self.registro is not None:
+                self.registro[lote_id] = [moeda, int(epoch), data_s, qtd, custo, int(ext)]
+        elif self.registro is not None:
+            ficha = self.registro[lote_id]
+            ficha[3] += qtd
+            ficha[4] += custo
+        return lote_id
+
+    def resumo_memoria(self) -> pd.DataFrame:
+        return pd.DataFrame([{
+            'Moeda': moeda,
+            'Lotes_Adicionados': l.n_adicionados,
+            'Lotes_Em_Aberto': len(l),
+            'Bytes': l.memoria(),
+        } for moeda, l in sorted(self.items())])
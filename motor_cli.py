@@ -0,0 +1,80 @@
+import time
+
+T_INICIO = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+# Os módulos pesados (pandas e o motor completo) só são importados quando o
+# caminho escolhido precisa deles. Extratos BitcoinTrade pequenos sem opções
+# avançadas vão pelo motor_leve (só biblioteca padrão).
+
+LIMITE_LEVE = 2 * 1024 * 1024  # bytes; ~20 mil linhas de extrato BitcoinTrade
+
+
+def escolher_modo(args) -> str:
+    if args.modo != "auto":
+        return args.modo
+    if len(args.extratos) != 1:
+        return "completo"
+    if args.verificar or args.tz_fiscal or args.compactar_lotes or args.sqlite or args.casar_pernas or args.resumos:
+        return "completo"
+    path = args.extratos[0]
+    if os.path.getsize(path) > args.limite_leve:
+        return "completo"
+    from motor_leve import e_formato_bitcointrade
+    return "leve" if e_formato_bitcointrade(path) else "completo"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Motor FIFO BitcoinTrade (relatórios IRS, swaps e reconciliação).")
+    parser.add_argument("extratos", nargs="*", default=["BitcoinTrade_statement.csv"],
+                        help="Um ou mais extratos (qualquer formato suportado por adaptadores.py).")
+    parser.add_argument("--modo", choices=["auto", "leve", "completo"], default="auto",
+                        help="auto: motor leve para extratos BitcoinTrade pequenos, completo nos restantes.")
+    parser.add_argument("--limite-leve", type=int, default=LIMITE_LEVE, help="Tamanho máximo (bytes) para o motor leve.")
+    parser.add_argument("--verificar", choices=["completo", "amostragem", "checkpoint"])
+    parser.add_argument("--intervalo-verificacao", type=int, default=1000)
+    parser.add_argument("--tz-fiscal")
+    parser.add_argument("--compactar-lotes", action="store_true")
+    parser.add_argument("--sqlite", metavar="DB")
+    parser.add_argument("--casar-pernas", action="store_true",
+                        help="Contraparte por perna em segundos com várias trocas (ver contraparte.py).")
+    parser.add_argument("--janela-casamento", type=int, default=0, metavar="S",
+                        help="Segundos extra para casar pernas de segundos seguintes (com --casar-pernas).")
+    parser.add_argument("--resumos", metavar="PASTA", help="Guarda resumos por ativo/ano/mês (servidos por resumos.py).")
+    args = parser.parse_args(argv)
+
+    for p in args.extratos:
+        if not os.path.exists(p):
+            print(f"Erro: Arquivo {p} não encontrado!")
+            return 1
+
+    modo = escolher_modo(args)
+    if modo == "leve":
+        if len(args.extratos) != 1:
+            parser.error("o motor leve processa um único extrato")
+        from motor_leve import processar_motor_leve
+        stats = processar_motor_leve(args.extratos[0])
+        t_primeira = stats["t_primeira_linha"]
+    else:
+        t_import = time.perf_counter()
+        from Motor_BitcoinTrade_v4 import processar_motor_v6
+        print(f"Importação do motor completo: {(time.perf_counter() - t_import) * 1000:.0f} ms")
+        processar_motor_v6(args.extratos, verificar=args.verificar, intervalo_verificacao=args.intervalo_verificacao,
+                           tz_fiscal=args.tz_fiscal, compactar_lotes=args.compactar_lotes, sqlite_path=args.sqlite,
+                           casar_pernas=args.casar_pernas, janela_casamento=args.janela_casamento,
+                           resumos_dir=args.resumos)
+        t_primeira = None
+
+    t_fim = time.perf_counter()
+    if t_primeira is not None:
+        print(f"Motor {modo}: primeira linha em {(t_primeira - T_INICIO) * 1000:.0f} ms | total {(t_fim - T_INICIO) * 1000:.0f} ms")
+    else:
+        print(f"Motor {modo}: total {(t_fim - T_INICIO) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
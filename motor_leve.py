@@ -0,0 +1,189 @@
+import csv
+import datetime
+import re
+import time
+
+# Caminho leve do motor v6 (Motor_BitcoinTrade_v4.processar_motor_v6) para
+# extratos pequenos da BitcoinTrade: só biblioteca padrão, sem pandas. Gera os
+# mesmos três relatórios, byte a byte. Não suporta multi-exchange, fusos,
+# verificação de invariantes, compactação nem exportação SQLite; para isso
+# usa-se o motor completo (ver motor_cli.py).
+
+COLUNAS_BT = ("Data", "Hora", "Moeda", "Categoria", "Quantidade")
+
+FIAT_BASE = ('Real Brasileiro', 'BRL', 'Euro', 'EUR')
+FIAT_LIST = ('Real Brasileiro', 'BRL', 'Euro', 'EUR', 'US Dollar', 'USD', 'cReal', 'BRLT', 'Tether', 'USDT', 'USDC')
+FIAT_IRS = ('Real Brasileiro', 'BRL', 'Euro', 'EUR', 'BRLT')
+
+COLS_IRS = ['Data_Venda', 'Ativo', 'Moeda_Venda', 'Valor_Venda', 'Data_Aquisicao',
+            'Custo_Aquisicao_USD', 'Origem_Externa', 'Resultado', 'Isento_365d']
+COLS_RECON = ['Data', 'Hora', 'Moeda', 'Qtd', 'Tipo', 'Status']
+
+_ORDINAL_EPOCH = datetime.date(1970, 1, 1).toordinal()
+_RE_LIMPA = re.compile(r'[^\d,\.-]')
+
+
+def clean_val(val_str):
+    if val_str is None or val_str == '': return 0.0
+    s = _RE_LIMPA.sub('', val_str)
+    if ',' in s and '.' in s:
+        s = s.replace('.', '').replace(',', '.')
+    elif ',' in s:
+        s = s.replace(',', '.')
+    try: return float(s)
+    except ValueError: return 0.0
+
+
+def _round_np(x, casas):
+    # Mesmo arredondamento de numpy.round (o motor completo arredonda float64 do numpy)
+    f = 10.0 ** casas
+    return round(x * f) / f
+
+
+def e_formato_bitcointrade(file_path):
+    with open(file_path, encoding='utf-8-sig', newline='') as fh:
+        header = next(csv.reader(fh, delimiter=';'), [])
+    return all(c in header for c in COLUNAS_BT)
+
+
+def _ler(file_path):
+    dias, segs = {}, {}
+    linhas = []
+    t_primeira = None
+    with open(file_path, encoding='utf-8-sig', newline='') as fh:
+        reader = csv.DictReader(fh, delimiter=';')
+        for r in reader:
+            if t_primeira is None:
+                t_primeira = time.perf_counter()
+            # Datas e horas repetem-se: cada valor distinto é convertido uma vez
+            d = dias.get(r['Data'])
+            if d is None:
+                try:
+                    dd, mm, yy = r['Data'].split('/')
+                    d = datetime.date(int(yy), int(mm), int(dd)).toordinal() - _ORDINAL_EPOCH
+                except (ValueError, AttributeError):
+                    d = False
+                dias[r['Data']] = d
+            h = segs.get(r['Hora'])
+            if h is None:
+                try:
+                    hh, mi, ss = r['Hora'].split(':')
+                    h = int(hh) * 3600 + int(mi) * 60 + int(ss)
+                except (ValueError, AttributeError):
+                    h = False
+                segs[r['Hora']] = h
+            if d is False or h is False:
+                raise ValueError(f"Data/hora inválida no extrato: {r['Data']!r} {r['Hora']!r}")
+            linhas.append((d * 86400 + h, r['Categoria'], r['Moeda'].strip(), clean_val(r['Quantidade'])))
+    # Mesma ordem do motor completo: (epoch, categoria), estável
+    linhas.sort(key=lambda l: (l[0], l[1]))
+    return linhas, t_primeira
+
+
+def _gravar(path, colunas, linhas):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as fh:
+        if not linhas:
+            fh.write('\n')
+            return
+        w = csv.writer(fh, delimiter=';', lineterminator='\n')
+        w.writerow(colunas)
+        for l in linhas:
+            w.writerow([repr(v) if isinstance(v, float) else v for v in (l[c] for c in colunas)])
+
+
+def processar_motor_leve(file_path):
+    linhas, t_primeira = _ler(file_path)
+
+    datas = {}
+    inventory = {}  # moeda -> [[qtd, custo, epoch, data_s, ext], ...], com índice de cabeça
+    cabeca = {}
+    log_irs, log_swaps, log_recon = [], [], []
+
+    i, n = 0, len(linhas)
+    while i < n:
+        ep = linhas[i][0]
+        j = i
+        while j < n and linhas[j][0] == ep:
+            j += 1
+        group = linhas[i:j]
+        i = j
+
+        dia = ep // 86400
+        data_s = datas.get(dia)
+        if data_s is None:
+            data_s = datas[dia] = datetime.date.fromordinal(dia + _ORDINAL_EPOCH).isoformat()
+        s = ep % 86400
+        hora_s = f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}"
+
+        # 1. ENTRADAS DE CRIPTO
+        for _, cat, moeda, val in group:
+            if not (val > 0 and moeda not in FIAT_BASE):
+                continue
+            qtd = abs(val)
+            if "Depósito" in cat:
+                custo_total = 0.0
+                ext = True
+                log_recon.append({'Data': data_s, 'Hora': hora_s, 'Moeda': moeda, 'Qtd': qtd, 'Tipo': 'Depósito', 'Status': 'Origem Externa (Custo 0)'})
+            else:
+                ext = False
+                pagos = [v for _, _, m, v in group if v < 0 and m in FIAT_LIST]
+                custo_total = abs(sum(pagos)) if pagos else 0.0
+            inventory.setdefault(moeda, []).append([qtd, custo_total, ep, data_s, ext])
+            cabeca.setdefault(moeda, 0)
+
+        # 2. SAÍDAS DE CRIPTO
+        entradas_seg = [(m, v) for _, _, m, v in group if v > 0]
+        if entradas_seg:
+            moeda_recebida = entradas_seg[0][0]
+            valor_recebido = sum(v for _, v in entradas_seg)
+        else:
+            moeda_recebida = "Carteira Externa"
+            valor_recebido = 0.0
+
+        for _, cat, moeda_v, val in group:
+            if not (val < 0 and moeda_v not in FIAT_BASE) or "Taxa" in cat:
+                continue
+            qtd_v = abs(val)
+            if moeda_v not in inventory:
+                continue
+            lotes = inventory[moeda_v]
+            restante = qtd_v
+            while restante > 1e-9 and cabeca[moeda_v] < len(lotes):
+                lote = lotes[cabeca[moeda_v]]
+                qtd_a_retirar = min(lote[0], restante)
+                prop_lote = qtd_a_retirar / lote[0]
+                prop_saida = qtd_a_retirar / qtd_v if qtd_v > 0 else 0
+                custo_lote = lote[1] * prop_lote
+                valor_venda_lote = valor_recebido * prop_saida
+
+                dias = (ep - lote[2]) // 86400
+                isento_status = "TBD" if lote[4] else f"{'SIM' if dias > 365 else 'NÃO'} ({dias} dias)"
+
+                linha = {
+                    'Data_Venda': data_s, 'Ativo': moeda_v, 'Moeda_Venda': moeda_recebida,
+                    'Valor_Venda': _round_np(valor_venda_lote, 2), 'Data_Aquisicao': lote[3],
+                    'Custo_Aquisicao_USD': _round_np(custo_lote, 2), 'Origem_Externa': "Sim" if lote[4] else "Não",
+                    'Resultado': _round_np(valor_venda_lote - custo_lote, 2), 'Isento_365d': isento_status
+                }
+
+                if "Retirada" in cat:
+                    log_recon.append({'Data': data_s, 'Hora': hora_s, 'Moeda': moeda_v, 'Qtd': qtd_v, 'Tipo': 'Retirada', 'Status': 'Saída para Externa'})
+                elif moeda_recebida in FIAT_IRS:
+                    log_irs.append(linha)
+                else:
+                    log_swaps.append(linha)
+
+                if lote[0] <= restante:
+                    restante -= lote[0]
+                    cabeca[moeda_v] += 1
+                else:
+                    lote[0] -= restante
+                    lote[1] -= custo_lote
+                    restante = 0
+
+    _gravar('Arquivo1_IRS.csv', COLS_IRS, log_irs)
+    _gravar('Arquivo2_Swaps.csv', COLS_IRS, log_swaps)
+    _gravar('Arquivo3_Reconciliacao.csv', COLS_RECON, log_recon)
+
+    print(f"Sucesso! IRS: {len(log_irs)} | Swaps: {len(log_swaps)} | Recon: {len(log_recon)}")
+    return {'irs': len(log_irs), 'swaps': len(log_swaps), 'recon': len(log_recon), 't_primeira_linha': t_primeira}
@@ -0,0 +1,398 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Todos os motores leem 'BitcoinTrade_statement.csv' do diretório corrente e
+# gravam os relatórios com nomes fixos; o harness corre cada um num diretório
+# temporário com o extrato copiado para esse nome.
+STATEMENT_NAME = "BitcoinTrade_statement.csv"
+
+MOTORES: Dict[str, Dict[str, Any]] = {
+    "v2": {
+        "script": "backup/Motor_v2.py",
+        "saidas": ["Relatorio_FIFO_Completo_Contraparte.csv"],
+    },
+    "v3": {
+        "script": "backup/Motor_BitcoinTrade_v3.py",
+        "saidas": ["Arquivo1_IRS.csv", "Arquivo2_Swaps.csv", "Arquivo3_Reconciliacao.csv"],
+    },
+    "v3_fix": {
+        "script": "backup/Motor_BT_v3_relatorios_fix.py",
+        "saidas": ["BT_Arquivo_1_IRS.csv", "BT_Arquivo_2_Swaps.csv", "BT_Arquivo_3_Reconciliacao.csv",
+                   "BT_Relatorio_FIFO_Completo_Contraparte.csv"],
+    },
+    "refinar": {
+        "script": "BTcode_Refinar.py",
+        "saidas": ["Relatorio_Corrigido_Final.csv"],
+    },
+    "v4": {
+        "script": "Motor_BitcoinTrade_v4.py",
+        "saidas": ["Arquivo1_IRS.csv", "Arquivo2_Swaps.csv", "Arquivo3_Reconciliacao.csv"],
+    },
+    "v4_leve": {
+        "script": "motor_cli.py",
+        "args": ["--modo", "leve"],
+        "saidas": ["Arquivo1_IRS.csv", "Arquivo2_Swaps.csv", "Arquivo3_Reconciliacao.csv"],
+    },
+}
+
+# Chaves de evento por relatório. Linhas com a mesma chave são desambiguadas
+# pela ordem de ocorrência (ex.: vários lotes FIFO consumidos na mesma venda).
+CHAVES: Dict[str, List[str]] = {
+    "Arquivo1_IRS.csv": ["Data_Venda", "Ativo", "Data_Aquisicao"],
+    "Arquivo2_Swaps.csv": ["Data_Venda", "Ativo", "Data_Aquisicao"],
+    "Arquivo3_Reconciliacao.csv": ["Data", "Moeda", "Tipo"],
+    "BT_Arquivo_1_IRS.csv": ["Data_Venda", "Moeda", "Data_Aquisição"],
+    "BT_Arquivo_2_Swaps.csv": ["Data", "hora", "Saiu"],
+    "BT_Arquivo_3_Reconciliacao.csv": ["Data", "hora", "Moeda", "Tipo"],
+    "BT_Relatorio_FIFO_Completo_Contraparte.csv": ["Data", "hora", "Moeda", "operação"],
+    "Relatorio_FIFO_Completo_Contraparte.csv": ["Data", "hora", "Moeda", "operação"],
+    "Relatorio_Corrigido_Final.csv": ["Data", "hora", "Moeda", "operação"],
+}
+
+ATOL_PADRAO = 1e-6
+
+# Casos sintéticos com o resultado esperado escrito à mão, para situações que o
+# extrato de exemplo não cobre. Cada caso corre o motor_cli num diretório
+# temporário com os extratos indicados; "esperado" lista só as colunas que
+# interessam (as restantes são ignoradas na comparação).
+CABECALHO_BT = '"Data";"Hora";"Moeda";"Categoria";"Quantidade";"Saldo"\n'
+
+CASOS: Dict[str, Dict[str, Any]] = {
+    # 16/02/2019 23:30 repete-se em São Paulo (fim do horário de verão). A compra
+    # não pode desaparecer na conversão para o fuso fiscal.
+    "dst_sao_paulo": {
+        "extratos": {"bt.csv": CABECALHO_BT + (
+            '"20/02/2019";"10:00:00";"Real Brasileiro";"Venda";"R$ 1.200,00";"R$ 1.200,00"\n'
+            '"20/02/2019";"10:00:00";"Bitcoin";"Venda";"-BTC 0,10000000";"BTC 0,00000000"\n'
+            '"16/02/2019";"23:30:00";"Bitcoin";"Compra";"BTC 0,10000000";"BTC 0,10000000"\n'
+            '"16/02/2019";"23:30:00";"Real Brasileiro";"Compra";"-R$ 1.000,00";"R$ 0,00"\n'
+            '"16/02/2019";"10:00:00";"Real Brasileiro";"Depósito bancário";"R$ 1.000,00";"R$ 1.000,00"\n')},
+        "args": ["--tz-fiscal", "Europe/Lisbon"],
+        "esperado": {"Arquivo1_IRS.csv": [
+            {"Data_Venda": "2019-02-20", "Ativo": "Bitcoin", "Valor_Venda": "1200.0", "Data_Aquisicao": "2019-02-17",
+             "Custo_Aquisicao_USD": "1000.0", "Resultado": "200.0", "Isento_365d": "NÃO (3 dias)"},
+        ]},
+    },
+    # Compactar lotes não pode mudar o período de detenção: 20:00 -> 10:00 do
+    # mesmo dia um ano depois são 365 dias completos (não isento).
+    "compactar_detencao": {
+        "extratos": {"bt.csv": CABECALHO_BT + (
+            '"01/01/2021";"10:00:00";"Real Brasileiro";"Venda";"R$ 2.000,00";"R$ 2.000,00"\n'
+            '"01/01/2021";"10:00:00";"Bitcoin";"Venda";"-BTC 0,20000000";"BTC 0,00000000"\n'
+            '"01/01/2020";"20:00:00";"Bitcoin";"Compra";"BTC 0,10000000";"BTC 0,20000000"\n'
+            '"01/01/2020";"20:00:00";"Real Brasileiro";"Compra";"-R$ 500,00";"R$ 0,00"\n'
+            '"01/01/2020";"09:00:00";"Bitcoin";"Compra";"BTC 0,10000000";"BTC 0,10000000"\n'
+            '"01/01/2020";"09:00:00";"Real Brasileiro";"Compra";"-R$ 500,00";"R$ 500,00"\n'
+            '"01/01/2020";"08:00:00";"Real Brasileiro";"Depósito bancário";"R$ 1.000,00";"R$ 1.000,00"\n')},
+        "args": ["--compactar-lotes"],
+        "esperado": {"Arquivo1_IRS.csv": [
+            {"Data_Venda": "2021-01-01", "Ativo": "Bitcoin", "Data_Aquisicao": "2020-01-01", "Isento_365d": "SIM (366 dias)"},
+            {"Data_Venda": "2021-01-01", "Ativo": "Bitcoin", "Data_Aquisicao": "2020-01-01", "Isento_365d": "NÃO (365 dias)"},
+        ]},
+    },
+    # Duas ordens no mesmo segundo com as pernas fora de ordem no extrato: o par
+    # 1:1 daria preços de 1000 e 2000 por BTC, por isso o casamento reparte o
+    # total (R$ 500 por 0,3 BTC) e o primeiro lote custa 166.67.
+    "casar_pernas_preco": {
+        "extratos": {"bt.csv": CABECALHO_BT + (
+            '"10/03/2021";"10:00:00";"Real Brasileiro";"Venda";"R$ 200,00";"R$ 500,00"\n'
+            '"10/03/2021";"10:00:00";"Bitcoin";"Venda";"-BTC 0,10000000";"BTC 0,20000000"\n'
+            '"01/03/2021";"10:00:00";"Real Brasileiro";"Compra";"-R$ 100,00";"R$ 300,00"\n'
+            '"01/03/2021";"10:00:00";"Real Brasileiro";"Compra";"-R$ 400,00";"R$ 400,00"\n'
+            '"01/03/2021";"10:00:00";"Bitcoin";"Compra";"BTC 0,20000000";"BTC 0,30000000"\n'
+            '"01/03/2021";"10:00:00";"Bitcoin";"Compra";"BTC 0,10000000";"BTC 0,10000000"\n'
+            '"01/03/2021";"09:00:00";"Real Brasileiro";"Depósito bancário";"R$ 800,00";"R$ 800,00"\n')},
+        "args": ["--casar-pernas"],
+        "esperado": {"Arquivo1_IRS.csv": [
+            {"Data_Venda": "2021-03-10", "Ativo": "Bitcoin", "Valor_Venda": "200.0", "Custo_Aquisicao_USD": "166.67",
+             "Resultado": "33.33"},
+        ]},
+    },
+    # Um segundo com compras de dois ativos (e outro com as vendas): cada ativo
+    # fica com o custo e o valor de venda das suas próprias pernas de fiat.
+    "casar_pernas_dois_ativos": {
+        "extratos": {"bt.csv": CABECALHO_BT + (
+            '"11/03/2021";"10:00:00";"Real Brasileiro";"Venda";"R$ 2.000,00";"R$ 52.000,00"\n'
+            '"11/03/2021";"10:00:00";"Ethereum";"Venda";"-ETH 1,00000000";"ETH 0,00000000"\n'
+            '"11/03/2021";"10:00:00";"Real Brasileiro";"Venda";"R$ 50.000,00";"R$ 50.000,00"\n'
+            '"11/03/2021";"10:00:00";"Bitcoin";"Venda";"-BTC 1,00000000";"BTC 0,00000000"\n'
+            '"10/03/2021";"10:00:00";"Real Brasileiro";"Compra";"-R$ 1.000,00";"R$ 0,00"\n'
+            '"10/03/2021";"10:00:00";"Ethereum";"Compra";"ETH 1,00000000";"ETH 1,00000000"\n'
+            '"10/03/2021";"10:00:00";"Real Brasileiro";"Compra";"-R$ 40.000,00";"R$ 1.000,00"\n'
+            '"10/03/2021";"10:00:00";"Bitcoin";"Compra";"BTC 1,00000000";"BTC 1,00000000"\n'
+            '"10/03/2021";"09:00:00";"Real Brasileiro";"Depósito bancário";"R$ 41.000,00";"R$ 41.000,00"\n')},
+        "args": ["--casar-pernas"],
+        "esperado": {"Arquivo1_IRS.csv": [
+            {"Data_Venda": "2021-03-11", "Ativo": "Ethereum", "Valor_Venda": "2000.0", "Custo_Aquisicao_USD": "1000.0",
+             "Resultado": "1000.0"},
+            {"Data_Venda": "2021-03-11", "Ativo": "Bitcoin", "Valor_Venda": "50000.0", "Custo_Aquisicao_USD": "40000.0",
+             "Resultado": "10000.0"},
+        ]},
+    },
+}
+
+# Custo proporcional 1001.19 * 5/6 = 834.325: o motor arredonda como o numpy
+# (834.32), nos dois caminhos do motor_cli.
+_EXTRATO_ARREDONDAMENTO = CABECALHO_BT + (
+    '"10/03/2021";"10:00:00";"Real Brasileiro";"Venda";"R$ 1.000,00";"R$ 1.000,00"\n'
+    '"10/03/2021";"10:00:00";"Bitcoin";"Venda";"-BTC 5,00000000";"BTC 1,00000000"\n'
+    '"01/03/2021";"10:00:00";"Bitcoin";"Compra";"BTC 6,00000000";"BTC 6,00000000"\n'
+    '"01/03/2021";"10:00:00";"Real Brasileiro";"Compra";"-R$ 1.001,19";"R$ 0,00"\n'
+    '"01/03/2021";"09:00:00";"Real Brasileiro";"Depósito bancário";"R$ 1.001,19";"R$ 1.001,19"\n')
+for _modo in ("leve", "completo"):
+    CASOS[f"arredondamento_custo_{_modo}"] = {
+        "extratos": {"bt.csv": _EXTRATO_ARREDONDAMENTO},
+        "args": ["--modo", _modo],
+        "esperado": {"Arquivo1_IRS.csv": [
+            {"Data_Venda": "2021-03-10", "Ativo": "Bitcoin", "Valor_Venda": "1000.0", "Custo_Aquisicao_USD": "834.32",
+             "Resultado": "165.67"},
+        ]},
+    }
+
+
+def _numerico(s: pd.Series) -> Optional[pd.Series]:
+    """
+    Converte uma coluna de texto para float aceitando decimal ',' ou '.'
+    (os motores misturam os dois). Devolve None se a coluna não for numérica.
+    """
+    txt = s.astype("string").str.strip()
+    sem_ponto = ~txt.str.contains(".", regex=False).fillna(False)
+    txt = txt.where(~sem_ponto, txt.str.replace(",", ".", regex=False))
+    num = pd.to_numeric(txt, errors="coerce")
+    preenchidos = txt.notna() & (txt != "")
+    if preenchidos.any() and num[preenchidos].notna().all():
+        return num.astype("float64")
+    return None
+
+
+def ler_relatorio(path: str) -> pd.DataFrame:
+    if os.path.getsize(path) <= 3:  # vazio (possivelmente só o BOM)
+        return pd.DataFrame()
+    try:
+        return pd.read_csv(path, sep=";", dtype=str, encoding="utf-8-sig", keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def comparar_relatorios(
+    golden: pd.DataFrame,
+    candidato: pd.DataFrame,
+    chaves: Optional[Sequence[str]] = None,
+    tolerancias: Optional[Dict[str, float]] = None,
+    atol: float = ATOL_PADRAO,
+) -> Dict[str, Any]:
+    """
+    Compara dois relatórios por join nas chaves de evento (vetorizado).
+    Colunas numéricas são comparadas com tolerância absoluta por coluna; as
+    restantes por igualdade. Devolve o resumo com a primeira divergência.
+    """
+    tolerancias = tolerancias or {}
+    colunas = [c for c in golden.columns if c in candidato.columns]
+    if chaves is None:
+        chaves = [c for c in colunas if _numerico(golden[c]) is None]
+    chaves = [c for c in chaves if c in colunas]
+
+    resumo: Dict[str, Any] = {
+        "linhas_golden": len(golden),
+        "linhas_candidato": len(candidato),
+        "colunas_so_golden": [c for c in golden.columns if c not in candidato.columns],
+        "colunas_so_candidato": [c for c in candidato.columns if c not in golden.columns],
+    }
+
+    def preparar(df: pd.DataFrame) -> pd.DataFrame:
+        df = df[colunas].copy()
+        df["_pos"] = np.arange(len(df))
+        df["_ocorrencia"] = df.groupby(chaves, sort=False).cumcount() if chaves else df["_pos"]
+        return df
+
+    g = preparar(golden)
+    c = preparar(candidato)
+    on = list(chaves) + ["_ocorrencia"]
+    m = g.merge(c, on=on, how="outer", suffixes=("_g", "_c"), indicator=True)
+
+    divergente = m["_merge"] != "both"
+    por_coluna: Dict[str, Dict[str, float]] = {}
+    for col in colunas:
+        if col in chaves:
+            continue
+        a, b = m[f"{col}_g"], m[f"{col}_c"]
+        na, nb = _numerico(a), _numerico(b)
+        if na is not None and nb is not None:
+            diff = (na - nb).abs()
+            tol = tolerancias.get(col, atol)
+            ambos_nan = na.isna() & nb.isna()
+            ruim = ~ambos_nan & ((diff > tol) | (na.isna() != nb.isna())) & (m["_merge"] == "both")
+            m[f"_diff_{col}"] = diff
+            if ruim.any():
+                por_coluna[col] = {"n": int(ruim.sum()), "max_abs": float(diff[ruim].max())}
+        else:
+            ruim = (a.fillna("") != b.fillna("")) & (m["_merge"] == "both")
+            if ruim.any():
+                por_coluna[col] = {"n": int(ruim.sum()), "max_abs": float("nan")}
+        divergente |= ruim
+
+    resumo["apenas_golden"] = int((m["_merge"] == "left_only").sum())
+    resumo["apenas_candidato"] = int((m["_merge"] == "right_only").sum())
+    resumo["n_divergentes"] = int(divergente.sum())
+    resumo["por_coluna"] = por_coluna
+    resumo["primeira_divergencia"] = None
+
+    if divergente.any():
+        d = m[divergente].copy()
+        d["_ordem"] = d["_pos_g"].fillna(d["_pos_c"])
+        primeira = d.sort_values("_ordem").iloc[0]
+        resumo["primeira_divergencia"] = {
+            "linha_golden": None if pd.isna(primeira["_pos_g"]) else int(primeira["_pos_g"]),
+            "linha_candidato": None if pd.isna(primeira["_pos_c"]) else int(primeira["_pos_c"]),
+            "chave": {k: primeira[k] for k in chaves},
+            "golden": {col: primeira[f"{col}_g"] for col in colunas if col not in chaves},
+            "candidato": {col: primeira[f"{col}_c"] for col in colunas if col not in chaves},
+        }
+    return resumo
+
+
+def comparar_arquivos(golden_path: str, candidato_path: str, tolerancias: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    nome = os.path.basename(golden_path)
+    return comparar_relatorios(ler_relatorio(golden_path), ler_relatorio(candidato_path),
+                               chaves=CHAVES.get(nome), tolerancias=tolerancias)
+
+
+def executar_motor(motor: str, statement: str, out_dir: str) -> Dict[str, str]:
+    """
+    Corre um motor sobre o extrato num diretório temporário e copia os
+    relatórios gerados para out_dir. Devolve {nome_relatorio: caminho}.
+    """
+    spec = MOTORES[motor]
+    script = os.path.join(REPO_DIR, spec["script"])
+    os.makedirs(out_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(statement, os.path.join(tmp, STATEMENT_NAME))
+        env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        proc = subprocess.run([sys.executable, script, *spec.get("args", [])], cwd=tmp, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Motor {motor} falhou:\n{proc.stderr.strip()}")
+
+        saidas = {}
+        for nome in spec["saidas"]:
+            origem = os.path.join(tmp, nome)
+            if os.path.exists(origem):
+                destino = os.path.join(out_dir, nome)
+                shutil.copy(origem, destino)
+                saidas[nome] = destino
+    return saidas
+
+
+def comparar_com_golden(motor: str, statement: str, golden_dir: str, out_dir: str,
+                        tolerancias: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+    saidas = executar_motor(motor, statement, out_dir)
+    resultados = {}
+    for nome in MOTORES[motor]["saidas"]:
+        golden_path = os.path.join(golden_dir, nome)
+        if not os.path.exists(golden_path):
+            continue
+        if nome not in saidas:
+            resultados[nome] = {"erro": "relatório não gerado pelo motor"}
+            continue
+        resultados[nome] = comparar_arquivos(golden_path, saidas[nome], tolerancias)
+    return resultados
+
+
+def executar_caso(nome: str) -> Dict[str, Dict[str, Any]]:
+    caso = CASOS[nome]
+    with tempfile.TemporaryDirectory() as tmp:
+        for arquivo, conteudo in caso["extratos"].items():
+            with open(os.path.join(tmp, arquivo), "w", encoding="utf-8") as fh:
+                fh.write(conteudo)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        cmd = [sys.executable, os.path.join(REPO_DIR, "motor_cli.py"), *caso["extratos"], *caso.get("args", [])]
+        proc = subprocess.run(cmd, cwd=tmp, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Caso {nome} falhou:\n{proc.stderr.strip()}")
+        resultados = {}
+        for relatorio, linhas in caso["esperado"].items():
+            esperado = pd.DataFrame(linhas, dtype=str)
+            obtido = ler_relatorio(os.path.join(tmp, relatorio))
+            resultados[relatorio] = comparar_relatorios(esperado, obtido, chaves=CHAVES.get(relatorio))
+    return resultados
+
+
+def _imprimir(nome: str, r: Dict[str, Any]) -> None:
+    if "erro" in r:
+        print(f"[ERRO] {nome}: {r['erro']}")
+        return
+    status = "OK" if r["n_divergentes"] == 0 else "DIVERGE"
+    print(f"[{status}] {nome}: golden={r['linhas_golden']} candidato={r['linhas_candidato']} "
+          f"divergentes={r['n_divergentes']} (só golden={r['apenas_golden']}, só candidato={r['apenas_candidato']})")
+    for col, info in r["por_coluna"].items():
+        print(f"    {col}: {info['n']} linhas, max |diff| = {info['max_abs']}")
+    p = r["primeira_divergencia"]
+    if p:
+        print(f"    primeira divergência (linha golden {p['linha_golden']}, candidato {p['linha_candidato']}): {p['chave']}")
+        print(f"      golden:    {p['golden']}")
+        print(f"      candidato: {p['candidato']}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Regressão de motores FIFO contra relatórios golden.")
+    parser.add_argument("--motor", choices=sorted(MOTORES))
+    parser.add_argument("--casos", action="store_true", help="Corre os casos sintéticos (CASOS) em vez do golden.")
+    parser.add_argument("--statement", default=STATEMENT_NAME)
+    parser.add_argument("--golden-dir")
+    parser.add_argument("--out-dir", default="saida_regressao")
+    parser.add_argument("--gravar", action="store_true", help="Grava as saídas do motor como novos golden.")
+    parser.add_argument("--tol", action="append", default=[], metavar="COLUNA=VALOR",
+                        help="Tolerância absoluta por coluna (padrão %g)." % ATOL_PADRAO)
+    args = parser.parse_args(argv)
+
+    if args.casos:
+        ok = True
+        for nome in CASOS:
+            try:
+                resultados = executar_caso(nome)
+            except RuntimeError as e:
+                print(f"[ERRO] {nome}: {e}")
+                ok = False
+                continue
+            for relatorio, r in resultados.items():
+                _imprimir(f"{nome}/{relatorio}", r)
+                ok = ok and r["n_divergentes"] == 0
+        return 0 if ok else 1
+    if not args.motor or not args.golden_dir:
+        parser.error("--motor e --golden-dir são obrigatórios (exceto com --casos)")
+
+    if args.gravar:
+        saidas = executar_motor(args.motor, args.statement, args.golden_dir)
+        print(f"Golden gravados: {', '.join(sorted(saidas))}")
+        return 0
+
+    tolerancias = {}
+    for t in args.tol:
+        col, val = t.rsplit("=", 1)
+        tolerancias[col] = float(val)
+
+    try:
+        resultados = comparar_com_golden(args.motor, args.statement, args.golden_dir, args.out_dir, tolerancias)
+    except RuntimeError as e:
+        print(f"Erro: {e}")
+        return 2
+    if not resultados:
+        print("Nenhum golden correspondente encontrado.")
+        return 1
+    for nome, r in resultados.items():
+        _imprimir(nome, r)
+    return 0 if all(r.get("n_divergentes", 1) == 0 for r in resultados.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+
+import ledger_db
+import tempo
+
+# Resumos agregados dos relatórios do motor para dashboards. Os totais ficam
+# pré-calculados por ativo/ano/mês em uma pasta de cache (um JSON por chave).
+# A chave é a mesma dos runs do SQLite (ledger_db.chave_execucao): hash dos
+# extratos mais as opções que mudam o resultado. O servidor HTTP só lê essa
+# cache e não volta a rodar o replay FIFO; o motor só é importado para gerar.
+#
+# Taxas, retiradas, depósitos e quantidade em aberto estão na unidade de cada
+# ativo: só aparecem nas consultas agrupadas ou filtradas por ativo.
+#
+#   python resumos.py gerar extrato.csv --cache resumos
+#   python resumos.py servir --cache resumos --porta 8765
+#   curl 'localhost:8765/resumo/ultimo?agrupar=ativo,ano&ano=2021'
+#   curl 'localhost:8765/lotes/ultimo?agrupar=ativo'
+
+DIMENSOES = ("ativo", "ano", "mes")
+
+# Métricas mensais. Valores em moeda fiat arredondam a 2 casas e quantidades a 8.
+METRICAS_VALOR = ("valor_venda", "custo_vendido", "ganho_realizado", "ganho_isento", "ganho_tributavel",
+                  "ganho_indeterminado", "ganho_swaps")
+METRICAS_QTD = ("taxas", "retiradas", "depositos")
+METRICAS_CONTAGEM = ("n_vendas", "n_swaps")
+METRICAS_LOTES = ("qtd_aberta", "custo_aberto", "n_lotes")
+
+
+def _ano_mes(data_s: str):
+    return int(data_s[:4]), int(data_s[5:7])
+
+
+def calcular_resumo(estado, df) -> Dict[str, Any]:
+    """Totais mensais a partir do estado de um replay (EstadoFIFO) e dos eventos preparados."""
+    linhas: Dict[tuple, Dict[str, float]] = {}
+
+    def linha(ativo, data_s):
+        k = (ativo, *_ano_mes(data_s))
+        l = linhas.get(k)
+        if l is None:
+            l = linhas[k] = dict.fromkeys(METRICAS_VALOR + METRICAS_QTD + METRICAS_CONTAGEM, 0)
+        return l
+
+    for log, swap in ((estado.log_irs, False), (estado.log_swaps, True)):
+        for r in log:
+            l = linha(r['Ativo'], r['Data_Venda'])
+            resultado = float(r['Resultado'])
+            l['valor_venda'] += float(r['Valor_Venda'])
+            l['custo_vendido'] += float(r['Custo_Aquisicao_USD'])
+            l['ganho_realizado'] += resultado
+            isento = r['Isento_365d']
+            if isento.startswith('SIM'):
+                l['ganho_isento'] += resultado
+            elif isento.startswith('NÃO'):
+                l['ganho_tributavel'] += resultado
+            else:
+                l['ganho_indeterminado'] += resultado  # lote de origem externa (TBD)
+            if swap:
+                l['ganho_swaps'] += resultado
+                l['n_swaps'] += 1
+            else:
+                l['n_vendas'] += 1
+
+    # Taxas e movimentos vêm dos eventos: o relatório de reconciliação repete
+    # a quantidade da retirada por cada lote consumido.
+    cat = df['Categoria'].astype(str)
+    val = df['Val_Numeric']
+    for metrica, mascara in (('taxas', cat.str.contains('Taxa', regex=False) & (val < 0)),
+                             ('retiradas', cat.str.contains('Retirada', regex=False) & (val < 0)),
+                             ('depositos', cat.str.contains('Depósito', regex=False) & (val > 0))):
+        sel = df[mascara]
+        somas = sel['Val_Numeric'].abs().groupby([sel['Moeda'].astype(str), sel['Data_Str'].str[:7]]).sum()
+        for (ativo, ano_mes), v in somas.items():
+            linha(ativo, ano_mes)[metrica] += float(v)
+
+    # Custo dos lotes em aberto, pelo mês de aquisição
+    abertos = [(ativo, epoch, qtd, custo) for ativo, fila in estado.inventory.items()
+               for epoch, qtd, custo, _ in fila.em_aberto() if qtd > 1e-9]
+    datas = tempo.formatar(np.array([a[1] for a in abertos], dtype='int64'), '%Y-%m-%d')
+    lotes: Dict[tuple, Dict[str, float]] = {}
+    for (ativo, _, qtd, custo), data_s in zip(abertos, datas):
+        k = (ativo, *_ano_mes(data_s))
+        l = lotes.setdefault(k, dict.fromkeys(METRICAS_LOTES, 0))
+        l['qtd_aberta'] += qtd
+        l['custo_aberto'] += custo
+        l['n_lotes'] += 1
+
+    def para_lista(d):
+        return [dict(zip(DIMENSOES, k), **v) for k, v in sorted(d.items())]
+
+    return {"mensal": para_lista(linhas), "lotes_abertos": para_lista(lotes)}
+
+
+class CacheResumos:
+    """Pasta com um JSON por chave. Os arquivos lidos ficam em memória até mudarem no disco."""
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        self._memoria: Dict[str, tuple] = {}  # chave -> (mtime, resumo)
+        self._lock = threading.Lock()
+
+    def caminho(self, chave: str) -> str:
+        return os.path.join(self.pasta, f"{chave}.json")
+
+    def existe(self, chave: str) -> bool:
+        return os.path.exists(self.caminho(chave))
+
+    def guardar(self, resumo: Dict[str, Any]) -> str:
+        os.makedirs(self.pasta, exist_ok=True)
+        path = self.caminho(resumo["chave"])
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(resumo, fh, ensure_ascii=False)
+        os.replace(tmp, path)  # atômico: o servidor nunca lê um arquivo pela metade
+        return path
+
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        if chave == "ultimo":
+            recentes = self.listar()
+            if not recentes:
+                return None
+            chave = recentes[0]["chave"]
+        if not all(c in "0123456789abcdef" for c in chave):
+            return None
+        path = self.caminho(chave)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            em_memoria = self._memoria.get(chave)
+            if em_memoria and em_memoria[0] == mtime:
+                return em_memoria[1]
+        with open(path, encoding="utf-8") as fh:
+            resumo = json.load(fh)
+        with self._lock:
+            self._memoria[chave] = (mtime, resumo)
+        return resumo
+
+    def listar(self) -> List[Dict[str, Any]]:
+        """Metadados dos resumos guardados, do mais recente para o mais antigo."""
+        if not os.path.isdir(self.pasta):
+            return []
+        itens = []
+        for nome in os.listdir(self.pasta):
+            if nome.endswith(".json"):
+                r = self.obter(nome[:-5])
+                if r:
+                    itens.append({k: r[k] for k in ("chave", "gerado", "fontes", "opcoes")})
+        return sorted(itens, key=lambda r: r["gerado"], reverse=True)
+
+
+def guardar_resumo(pasta: str, paths: Sequence[str], estado, df, opcoes: Dict[str, Any],
+                   hash_entradas: Optional[str] = None) -> str:
+    if hash_entradas is None:
+        hash_entradas = ledger_db.hash_entradas(paths)
+    resumo = {
+        "chave": ledger_db.chave_execucao(hash_entradas, opcoes),
+        "hash_entradas": hash_entradas,
+        "gerado": datetime.datetime.now().isoformat(timespec="seconds"),
+        "fontes": [os.path.basename(p) for p in paths],
+        "opcoes": ledger_db.opcoes_motor(opcoes),
+        **calcular_resumo(estado, df),
+    }
+    CacheResumos(pasta).guardar(resumo)
+    return resumo["chave"]
+
+
+def gerar(paths: Sequence[str], pasta: str, **opcoes) -> tuple:
+    """Corre o replay só se a combinação extratos+opções ainda não estiver na cache. Devolve (chave, gerado)."""
+    h = ledger_db.hash_entradas(paths)
+    chave = ledger_db.chave_execucao(h, opcoes)
+    if CacheResumos(pasta).existe(chave):
+        return chave, False
+
+    import Motor_BitcoinTrade_v4 as motor
+    from adaptadores import carregar_eventos
+    o = ledger_db.opcoes_motor(opcoes)
+    df = motor.preparar_eventos(carregar_eventos(paths, tz_fiscal=o["tz_fiscal"]), o["casar_pernas"], o["janela_casamento"])
+    estado = motor.EstadoFIFO(compactar_lotes=o["compactar_lotes"])
+    motor.replay_v6(df, estado)
+    return guardar_resumo(pasta, paths, estado, df, opcoes, hash_entradas=h), True
+
+
+def consultar(linhas: Iterable[Dict[str, Any]], agrupar: Sequence[str] = (), **filtros) -> List[Dict[str, Any]]:
+    """
+    Soma as linhas mensais pelas dimensões pedidas (subconjunto de ativo, ano,
+    mes), depois de filtrar. Sem ativo no agrupamento nem no filtro, as
+    métricas em quantidade ficam de fora (somariam BTC com ETH e BRL).
+    """
+    for d in agrupar:
+        if d not in DIMENSOES:
+            raise ValueError(f"dimensão desconhecida: {d} (use {', '.join(DIMENSOES)})")
+    filtros = {k: v for k, v in filtros.items() if v is not None}
+    por_ativo = "ativo" in agrupar or "ativo" in filtros
+    totais: Dict[tuple, Dict[str, Any]] = {}
+    for l in linhas:
+        if any(l[k] != v for k, v in filtros.items()):
+            continue
+        k = tuple(l[d] for d in agrupar)
+        t = totais.get(k)
+        if t is None:
+            t = totais[k] = dict(zip(agrupar, k))
+        for m, v in l.items():
+            if m in DIMENSOES or (not por_ativo and (m in METRICAS_QTD or m == "qtd_aberta")):
+                continue
+            t[m] = t.get(m, 0) + v
+    saida = [totais[k] for k in sorted(totais)]
+    for t in saida:
+        for m, v in t.items():
+            if m in METRICAS_VALOR or m == "custo_aberto":
+                t[m] = round(v, 2)
+            elif m in METRICAS_QTD or m == "qtd_aberta":
+                t[m] = round(v, 8)
+    return saida
+
+
+class _Handler(BaseHTTPRequestHandler):
+    cache: CacheResumos = None
+
+    def _responder(self, status: int, corpo: Any) -> None:
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        partes = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if partes == ["resumos"]:
+            return self._responder(200, self.cache.listar())
+        if len(partes) != 2 or partes[0] not in ("resumo", "lotes"):
+            return self._responder(404, {"erro": "use /resumos, /resumo/<chave> ou /lotes/<chave>"})
+
+        resumo = self.cache.obter(partes[1])
+        if resumo is None:
+            return self._responder(404, {"erro": f"resumo {partes[1]} não encontrado"})
+        try:
+            filtros = {"ativo": q.get("ativo"),
+                       "ano": int(q["ano"]) if "ano" in q else None,
+                       "mes": int(q["mes"]) if "mes" in q else None}
+            agrupar = [d for d in q.get("agrupar", "").split(",") if d]
+            tabela = resumo["mensal"] if partes[0] == "resumo" else resumo["lotes_abertos"]
+            linhas = consultar(tabela, agrupar, **filtros)
+        except ValueError as e:
+            return self._responder(400, {"erro": str(e)})
+        self._responder(200, {"chave": resumo["chave"], "fontes": resumo["fontes"], "linhas": linhas})
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def servir(pasta: str, host: str = "127.0.0.1", porta: int = 8765) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"cache": CacheResumos(pasta)})
+    return ThreadingHTTPServer((host, porta), handler)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Resumos agregados (ativo/ano/mês) dos relatórios do motor FIFO.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_gerar = sub.add_parser("gerar", help="Calcula e guarda os resumos de um ou mais extratos.")
+    p_gerar.add_argument("extratos", nargs="+")
+    p_gerar.add_argument("--cache", default="resumos")
+    p_gerar.add_argument("--tz-fiscal")
+    p_gerar.add_argument("--compactar-lotes", action="store_true")
+    p_gerar.add_argument("--casar-pernas", action="store_true")
+    p_gerar.add_argument("--janela-casamento", type=int, default=0)
+
+    p_servir = sub.add_parser("servir", help="Servidor HTTP/JSON local sobre a cache de resumos.")
+    p_servir.add_argument("--cache", default="resumos")
+    p_servir.add_argument("--host", default="127.0.0.1")
+    p_servir.add_argument("--porta", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    if args.comando == "gerar":
+        for p in args.extratos:
+            if not os.path.exists(p):
+                print(f"Erro: Arquivo {p} não encontrado!")
+                return 1
+        chave, gerado = gerar(args.extratos, args.cache, tz_fiscal=args.tz_fiscal,
+                              compactar_lotes=args.compactar_lotes, casar_pernas=args.casar_pernas,
+                              janela_casamento=args.janela_casamento)
+        print(f"Resumo {chave} {'gerado' if gerado else 'já em cache'} em {args.cache}")
+        return 0
+
+    servidor = servir(args.cache, args.host, args.porta)
+    print(f"Servindo resumos de {args.cache} em http://{args.host}:{args.porta}/ (Ctrl+C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
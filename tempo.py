@@ -0,0 +1,95 @@
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Camada de tempo: datas e horas dos extratos são convertidas para int64
+# "epoch" (segundos desde 1970-01-01 no relógio do fuso fiscal, sem fuso).
+# Datas e horas repetem-se muito num extrato, por isso cada valor distinto é
+# convertido uma única vez (factorize) e o resultado é espalhado pelos códigos.
+
+NAT = np.iinfo(np.int64).min  # mesmo valor que o NaT do numpy
+SEGUNDOS_DIA = 86400
+
+
+def _por_valor_unico(s: pd.Series, fn: Callable[[pd.Index], np.ndarray]) -> np.ndarray:
+    codes, uniques = pd.factorize(s)
+    valores = np.asarray(fn(uniques), dtype="int64")
+    out = valores[codes] if len(valores) else np.full(len(codes), NAT, dtype="int64")
+    out[codes < 0] = NAT
+    return out
+
+
+def _para_int(ts) -> np.ndarray:
+    arr = np.asarray(ts, dtype="datetime64[s]")
+    return arr.astype("int64")
+
+
+def parse_datas(s: pd.Series, formato: str = "%d/%m/%Y") -> np.ndarray:
+    """Datas em texto -> epoch (int64, meia-noite). Inválidos viram NAT."""
+    return _por_valor_unico(s, lambda u: _para_int(pd.to_datetime(u, format=formato, errors="coerce")))
+
+
+def parse_horas(s: pd.Series, formato: str = "%H:%M:%S") -> np.ndarray:
+    """Horas em texto -> segundos desde a meia-noite (int64). Inválidos viram NAT."""
+    def conv(u):
+        t = pd.to_datetime(u, format=formato, errors="coerce")
+        return np.where(t.isna(), NAT, t.hour * 3600 + t.minute * 60 + t.second)
+    return _por_valor_unico(s, conv)
+
+
+def parse_timestamps(s: pd.Series, formato: str = "%Y-%m-%d %H:%M:%S") -> np.ndarray:
+    """Data e hora na mesma coluna -> epoch (int64)."""
+    return _por_valor_unico(s, lambda u: _para_int(pd.to_datetime(u, format=formato, errors="coerce")))
+
+
+def combinar(datas: np.ndarray, horas: np.ndarray) -> np.ndarray:
+    invalido = (datas == NAT) | (horas == NAT)
+    return np.where(invalido, NAT, datas + np.where(invalido, 0, horas))
+
+
+def converter_fuso(epoch: np.ndarray, tz_origem: Optional[str], tz_fiscal: Optional[str]) -> np.ndarray:
+    """
+    Converte o relógio local do extrato (tz_origem) para o relógio do fuso
+    fiscal. Sem os dois fusos definidos, não há conversão.
+
+    Horas ambíguas (a hora repetida no fim do horário de verão) são lidas
+    como hora padrão; horas inexistentes avançam para a primeira hora válida.
+    """
+    if not tz_origem or not tz_fiscal or tz_origem == tz_fiscal:
+        return epoch
+    idx = pd.DatetimeIndex(np.asarray(epoch).astype("datetime64[s]"))
+    idx = idx.tz_localize(tz_origem, ambiguous=np.zeros(len(idx), dtype=bool), nonexistent="shift_forward")
+    idx = idx.tz_convert(tz_fiscal).tz_localize(None)
+    return _para_int(idx)
+
+
+def para_timestamp(epoch: np.ndarray) -> pd.Series:
+    return pd.Series(np.asarray(epoch).astype("datetime64[s]"))
+
+
+def formatar(epoch, formato: str = "%Y-%m-%d") -> np.ndarray:
+    """
+    Formata uma coluna inteira de uma vez. Para formatos só de data, cada
+    dia distinto é formatado uma vez.
+    """
+    epoch = np.asarray(epoch, dtype="int64")
+    so_data = not any(d in formato for d in ("%H", "%M", "%S", "%I", "%p"))
+    so_hora = not any(d in formato for d in ("%Y", "%y", "%m", "%d", "%b", "%B", "%a", "%A", "%j"))
+    if so_data:
+        chave = np.where(epoch == NAT, NAT, epoch // SEGUNDOS_DIA * SEGUNDOS_DIA)
+    elif so_hora:
+        chave = np.where(epoch == NAT, NAT, epoch % SEGUNDOS_DIA)
+    else:
+        chave = epoch
+    codes, uniques = pd.factorize(chave)
+    txt = pd.DatetimeIndex(np.asarray(uniques).astype("datetime64[s]")).strftime(formato)
+    txt = np.asarray(txt, dtype=object)
+    out = txt[codes] if len(txt) else np.array([""] * len(codes), dtype=object)
+    out[(codes < 0) | (epoch == NAT)] = ""
+    return out
+
+
+def dias_entre(inicio: int, fim: int) -> int:
+    """Dias completos entre dois epochs (igual a Timedelta.days)."""
+    return (fim - inicio) // SEGUNDOS_DIA